@@ -1,11 +1,30 @@
 #!/usr/bin/env python3
 
+import argparse
 import sys
 import textwrap
 import math
 import os
+import numpy as np
+from collections import namedtuple
+from multiprocessing import Pool
 from Bio import SeqIO
 
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+# Non-standard residues share the last index, which has no energy contribution
+UNKNOWN = len(AMINO_ACIDS)
+ENCODING = np.full(256, UNKNOWN, dtype=np.intp)
+ENCODING[np.frombuffer(AMINO_ACIDS.encode(), dtype=np.uint8)] = np.arange(UNKNOWN)
+PATH = os.path.dirname(os.path.realpath(__file__))
+# Number of sequences sent to each worker at a time in batch mode
+CHUNK_SIZE = 64
+# Model files and window sizes (lc, uc, wc) of each prediction type
+MODES = {
+    "long": ("long", 1, 100, 10),
+    "short": ("short", 1, 25, 10),
+    "glob": ("long", 1, 100, 15),
+}
+
 
 def avg(lst):
     return sum(lst) / len(lst)
@@ -23,15 +42,24 @@ def aa_freq(_seq):
     return _freq
 
 
+def residue_index(aa):
+    """
+    Return the row/column of a residue in the dense parameter arrays.
+    """
+    return int(ENCODING[ord(aa)]) if ord(aa) < 256 else UNKNOWN
+
+
 def read_matrix(matrix_file):
-    _mtx = {}
+    """
+    Parse an energy matrix into a residue indexed array. Rows and
+    columns for non-standard residues are left as zeros.
+    """
+    _mtx = np.zeros((UNKNOWN + 1, UNKNOWN + 1))
     with open(matrix_file, "r") as _fhm:
         for _line in _fhm:
-            if _line.split()[0] in _mtx:
-                _mtx[_line.split()[0]][_line.split()[1]] = float(_line.split()[2])
-            else:
-                _mtx[_line.split()[0]] = {}
-                _mtx[_line.split()[0]][_line.split()[1]] = float(_line.split()[2])
+            _aa1, _aa2, _value = _line.split()[:3]
+            if _aa1 in AMINO_ACIDS and _aa2 in AMINO_ACIDS:
+                _mtx[residue_index(_aa1), residue_index(_aa2)] = float(_value)
     return _mtx
 
 
@@ -43,13 +71,68 @@ def read_histo(histo_file):
         for _line in fnh:
             if _line.startswith("#"):
                 continue
-            if float(_line.split()[1]) < h_min:
-                h_min = float(_line.split()[1])
-            if float(_line.split()[1]) > h_max:
-                h_max = float(_line.split()[1])
-            hist.append(float(_line.split()[-1]))
+            _fields = _line.split()
+            h_min = min(h_min, float(_fields[1]))
+            h_max = max(h_max, float(_fields[1]))
+            hist.append(float(_fields[-1]))
     h_step = (h_max - h_min) / (len(hist))
-    return hist, h_min, h_max, h_step
+    return np.array(hist), h_min, h_max, h_step
+
+
+def read_interface_comp(comp_file):
+    """
+    Parse the ANCHOR2 interface composition into a residue indexed array.
+    """
+    _comp = np.zeros(UNKNOWN + 1)
+    with open(comp_file, "r") as _fn:
+        for _line in _fn:
+            _aa, _value = _line.split()[1:3]
+            if _aa in AMINO_ACIDS:
+                _comp[residue_index(_aa)] = float(_value)
+    return _comp
+
+
+class Parameters:
+    """
+    IUPred2A and ANCHOR2 model parameters parsed into dense residue
+    indexed arrays. Use load_parameters() to share a single instance
+    between all the predictions of a run.
+    """
+
+    def __init__(self, path=PATH):
+        data = os.path.join(path, "data")
+        self.energy = {
+            "long": read_matrix(os.path.join(data, "iupred2_long_energy_matrix")),
+            "short": read_matrix(os.path.join(data, "iupred2_short_energy_matrix")),
+        }
+        self.histogram = {
+            "long": read_histo(os.path.join(data, "long_histogram")),
+            "short": read_histo(os.path.join(data, "short_histogram")),
+        }
+        self.anchor_energy = read_matrix(os.path.join(data, "anchor2_energy_matrix"))
+        self.interface_comp = read_interface_comp(os.path.join(data, "anchor2_interface_comp"))
+        # The interface energy only depends on the residue type
+        self.interface_energy = self.anchor_energy @ self.interface_comp
+
+    def mode(self, mode):
+        """
+        Return the window sizes, energy matrix and histogram of a prediction type.
+        """
+        model, lc, uc, wc = MODES.get(mode, MODES["long"])
+        return lc, uc, wc, self.energy[model], self.histogram[model]
+
+
+_PARAMETERS = {}
+
+
+def load_parameters(path=PATH):
+    """
+    Return the parameters stored in path/data. Files are only
+    parsed the first time a directory is requested in the process.
+    """
+    if path not in _PARAMETERS:
+        _PARAMETERS[path] = Parameters(path)
+    return _PARAMETERS[path]
 
 
 def smooth(energy_list, window):
@@ -69,27 +152,125 @@ def read_seq(fasta_file):
     return _seq
 
 
-def iupred(seq, mode):
-    if mode == "short":
-        lc = 1
-        uc = 25
-        wc = 10
-        mtx = read_matrix("{}/data/iupred2_short_energy_matrix".format(PATH))
-        histo, histo_min, histo_max, histo_step = read_histo("{}/data/short_histogram".format(PATH))
-
-    elif mode == 'glob':
-        lc = 1
-        uc = 100
-        wc = 15
-        mtx = read_matrix("{}/data/iupred2_long_energy_matrix".format(PATH))
-        histo, histo_min, histo_max, histo_step = read_histo("{}/data/long_histogram".format(PATH))
-
-    else:
-        lc = 1
-        uc = 100
-        wc = 10
-        mtx = read_matrix("{}/data/iupred2_long_energy_matrix".format(PATH))
-        histo, histo_min, histo_max, histo_step = read_histo("{}/data/long_histogram".format(PATH))
+def encode(seq):
+    """
+    Encode a protein sequence as an array of residue indexes.
+    """
+    return ENCODING[np.frombuffer(str(seq).encode("ascii", "replace"), dtype=np.uint8)]
+
+
+def window_composition(codes, lc, uc):
+    """
+    Amino acid frequencies in the window [idx - uc, idx + uc] of every
+    residue, excluding the positions closer than lc residues.
+    Computed from a cumulative count table instead of one dict per residue.
+    """
+    size = len(codes)
+    counts = np.zeros((size + 1, UNKNOWN + 1))
+    counts[1:] = np.cumsum(np.eye(UNKNOWN + 1)[codes], axis=0)
+    idx = np.arange(size)
+    comp = (counts[np.maximum(0, idx - lc)] - counts[np.maximum(0, idx - uc)] +
+            counts[np.minimum(size, idx + uc + 1)] - counts[np.minimum(size, idx + lc + 1)])
+    total = comp.sum(axis=1, keepdims=True)
+    return np.divide(comp, total, out=np.zeros_like(comp), where=total > 0)
+
+
+def window_sum(values, window):
+    """
+    Sum of values in [idx - window, idx + window] truncated at the sequence ends.
+    """
+    if not len(values):
+        return np.zeros(0)
+    kernel = np.ones(2 * window + 1)
+    return np.convolve(values, kernel)[window:window + len(values)]
+
+
+def moving_average(values, window):
+    """
+    Vectorized smooth() computed from cumulative sums.
+    """
+    size = len(values)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    idx = np.arange(size)
+    lower = np.maximum(0, idx - window)
+    upper = np.minimum(size, idx + window + 1)
+    return (cumulative[upper] - cumulative[lower]) / (upper - lower)
+
+
+def histogram_scores(energy, histo, histo_min, histo_max, histo_step):
+    """
+    Transform smoothed energies into IUPred scores using the histogram.
+    """
+    histo = np.asarray(histo)
+    bins = np.clip(((energy - histo_min) * (1 / histo_step)).astype(int), 0, len(histo) - 1)
+    scores = histo[bins]
+    scores[energy >= histo_max - 2 * histo_step] = 0
+    scores[energy <= histo_min + 2 * histo_step] = 1
+    return scores
+
+
+def globular_domains(seq, weighted_energy_score):
+    """
+    Return the globular domains report for the glob prediction type.
+    """
+    gr = []
+    in_gr = False
+    beg, end = 0, 0
+    for idx, val in enumerate(weighted_energy_score):
+        if in_gr and val <= 0.3:
+            gr.append({0: beg, 1: end})
+            in_gr = False
+        elif in_gr:
+            end += 1
+        if val > 0.3 and not in_gr:
+            beg = idx
+            end = idx
+            in_gr = True
+    if in_gr:
+        gr.append({0: beg, 1: end})
+    mgr = []
+    k = 0
+    kk = k + 1
+    if gr:
+        beg = gr[0][0]
+        end = gr[0][1]
+    nr = len(gr)
+    while k < nr:
+        if kk < nr and gr[kk][0] - end < 45:
+            beg = gr[k][0]
+            end = gr[kk][1]
+            kk += 1
+        elif end - beg + 1 < 35:
+            k += 1
+            if k < nr:
+                beg = gr[k][0]
+                end = gr[k][1]
+        else:
+            mgr.append({0: beg, 1: end})
+            k = kk
+            kk += 1
+            if k < nr:
+                beg = gr[k][0]
+                end = gr[k][1]
+    seq = seq.lower()
+    nr = 0
+    res = ""
+    for i in mgr:
+        res += seq[nr:i[0]] + seq[i[0]:i[1] + 1].upper()
+        nr = i[1] + 1
+    res += seq[nr:]
+    res = " ".join([res[i:i + 10] for i in range(0, len(res), 10)])
+    glob_text = "Number of globular domains: {}\n".format(len(mgr))
+    for n, i in enumerate(mgr):
+        glob_text += "          globular domain   {}.\t{}-{}\n".format(n + 1, i[0] + 1, i[1] + 1)
+    glob_text += "\n".join(textwrap.wrap(res, 70))
+    return glob_text
+
+
+def iupred(seq, mode, params=None):
+    if params is None:
+        params = load_parameters()
+    lc, uc, wc, mtx, (histo, histo_min, histo_max, histo_step) = params.mode(mode)
 
     unweighted_energy_score = [0] * len(seq)
     weighted_energy_score = [0] * len(seq)
@@ -98,10 +279,7 @@ def iupred(seq, mode):
     for idx in range(len(seq)):
         freq_dct = aa_freq(seq[max(0, idx - uc):max(0, idx - lc)] + seq[idx + lc + 1:idx + uc + 1])
         for aa, freq in freq_dct.items():
-            try:
-                unweighted_energy_score[idx] += mtx[seq[idx]][aa] * freq
-            except KeyError:
-                unweighted_energy_score[idx] += 0
+            unweighted_energy_score[idx] += mtx[residue_index(seq[idx]), residue_index(aa)] * freq
 
     if mode == 'short':
         for idx in range(len(seq)):
@@ -116,57 +294,7 @@ def iupred(seq, mode):
 
     glob_text = ""
     if mode == 'glob':
-        gr = []
-        in_gr = False
-        beg, end = 0, 0
-        for idx, val in enumerate(weighted_energy_score):
-            if in_gr and val <= 0.3:
-                gr.append({0: beg, 1: end})
-                in_gr = False
-            elif in_gr:
-                end += 1
-            if val > 0.3 and not in_gr:
-                beg = idx
-                end = idx
-                in_gr = True
-        if in_gr:
-            gr.append({0: beg, 1: end})
-        mgr = []
-        k = 0
-        kk = k + 1
-        if gr:
-            beg = gr[0][0]
-            end = gr[0][1]
-        nr = len(gr)
-        while k < nr:
-            if kk < nr and gr[kk][0] - end < 45:
-                beg = gr[k][0]
-                end = gr[kk][1]
-                kk += 1
-            elif end - beg + 1 < 35:
-                k += 1
-                if k < nr:
-                    beg = gr[k][0]
-                    end = gr[k][1]
-            else:
-                mgr.append({0: beg, 1: end})
-                k = kk
-                kk += 1
-                if k < nr:
-                    beg = gr[k][0]
-                    end = gr[k][1]
-        seq = seq.lower()
-        nr = 0
-        res = ""
-        for i in mgr:
-            res += seq[nr:i[0]] + seq[i[0]:i[1] + 1].upper()
-            nr = i[1] + 1
-        res += seq[nr:]
-        res = " ".join([res[i:i + 10] for i in range(0, len(res), 10)])
-        glob_text += "Number of globular domains: {}\n".format(len(mgr))
-        for n, i in enumerate(mgr):
-            glob_text += "          globular domain   {}.\t{}-{}\n".format(n + 1, i[0] + 1, i[1] + 1)
-        glob_text += "\n".join(textwrap.wrap(res, 70))
+        glob_text = globular_domains(seq, weighted_energy_score)
 
     for idx, val in enumerate(weighted_energy_score):
         if val <= histo_min + 2 * histo_step:
@@ -178,7 +306,37 @@ def iupred(seq, mode):
     return iupred_score, glob_text
 
 
-def anchor2(seq, iupred_scores):
+def iupred_vectorized(seq, mode, params=None):
+    """
+    NumPy implementation of iupred(), returning the same scores
+    as an array.
+    """
+    if params is None:
+        params = load_parameters()
+    lc, uc, wc, mtx, (histo, histo_min, histo_max, histo_step) = params.mode(mode)
+
+    codes = encode(seq)
+    freq = window_composition(codes, lc, uc)
+    unweighted_energy_score = np.einsum("ij,ij->i", mtx[codes], freq)
+
+    width = 2 * wc + 1
+    totals = window_sum(unweighted_energy_score, wc)
+    counts = window_sum(np.ones(len(codes)), wc)
+    if mode == 'short':
+        # Positions outside the sequence contribute a fixed energy
+        weighted_energy_score = (totals - 1.26 * (width - counts)) / width
+    else:
+        weighted_energy_score = totals / counts
+
+    glob_text = ""
+    if mode == 'glob':
+        glob_text = globular_domains(str(seq), weighted_energy_score)
+
+    iupred_score = histogram_scores(weighted_energy_score, histo, histo_min, histo_max, histo_step)
+    return iupred_score, glob_text
+
+
+def anchor2(seq, iupred_scores, params=None):
     local_window_size = 41
     iupred_window_size = 30
     local_smoothing_window = 5
@@ -186,26 +344,19 @@ def anchor2(seq, iupred_scores):
     par_b = 0.26
     par_c = 0.43
     iupred_limit = par_c - (par_a / par_b)
-    mtx = read_matrix('{}/data/anchor2_energy_matrix'.format(PATH))
-    interface_comp = {}
-    with open('{}/data/anchor2_interface_comp'.format(PATH)) as _fn:
-        for line in _fn:
-            interface_comp[line.split()[1]] = float(line.split()[2])
+    if params is None:
+        params = load_parameters()
+    mtx = params.anchor_energy
+    interface_comp = {aa: params.interface_comp[residue_index(aa)] for aa in AMINO_ACIDS}
     local_energy_score = [0] * len(seq)
     interface_energy_score = [0] * len(seq)
     energy_gain = [0] * len(seq)
     for idx in range(len(seq)):
         freq_dct = aa_freq(seq[max(0, idx - local_window_size):max(0, idx - 1)] + seq[idx + 2:idx + local_window_size + 1])
         for aa, freq in freq_dct.items():
-            try:
-                local_energy_score[idx] += mtx[seq[idx]][aa] * freq
-            except KeyError:
-                local_energy_score[idx] += 0
+            local_energy_score[idx] += mtx[residue_index(seq[idx]), residue_index(aa)] * freq
         for aa, freq in interface_comp.items():
-            try:
-                interface_energy_score[idx] += mtx[seq[idx]][aa] * freq
-            except KeyError:
-                interface_energy_score[idx] += 0
+            interface_energy_score[idx] += mtx[residue_index(seq[idx]), residue_index(aa)] * freq
         energy_gain[idx] = local_energy_score[idx] - interface_energy_score[idx]
     iupred_scores = smooth(iupred_scores, iupred_window_size)
     energy_gain = smooth(smooth(energy_gain, local_smoothing_window), local_smoothing_window)
@@ -222,56 +373,182 @@ def anchor2(seq, iupred_scores):
     return anchor_score
 
 
-PATH = os.path.dirname(os.path.realpath(__file__))
-help_msg = """Usage: {} (options) (seqfile) (iupred type)
-\tAvailable types: \"long\", \"short\", \"glob\"
-
-Options
-\t-d str   -   Location of data directory (default='./')
-\t-a       -   Enable ANCHOR2 predition\n""".format(sys.argv[0])
-if len(sys.argv) < 2:
-    sys.exit(help_msg)
-if not os.path.isfile(sys.argv[-2]):
-    sys.exit('Input sequence file not found at {}!\n{}'.format(sys.argv[-2], help_msg))
-if not os.path.isdir(PATH):
-    sys.exit('Data directory not found at {}!\n{}'.format(PATH, help_msg))
-if '-d' in sys.argv:
-    PATH = sys.argv[sys.argv.index('-d') + 1]
-    if not os.path.isdir(os.path.join(PATH, 'data')):
-        sys.exit('Data directory not found at {}!\n{}'.format(PATH, help_msg))
-
-if sys.argv[-1] not in ['short', 'long', 'glob']:
-    sys.exit('Wrong iupred2 option {}!\n{}'.format(sys.argv[-1], help_msg))
-
-# Print output message with run parameters
-print("""# IUPred2A: context-dependent prediction of protein disorder as a function of redox state and protein binding
+def anchor2_vectorized(seq, iupred_scores, params=None):
+    """
+    NumPy implementation of anchor2(), returning the same scores
+    as an array.
+    """
+    local_window_size = 41
+    iupred_window_size = 30
+    local_smoothing_window = 5
+    par_a = 0.0013
+    par_b = 0.26
+    par_c = 0.43
+    iupred_limit = par_c - (par_a / par_b)
+    if params is None:
+        params = load_parameters()
+    mtx = params.anchor_energy
+    interface_energy = params.interface_energy
+
+    codes = encode(seq)
+    freq = window_composition(codes, 1, local_window_size)
+    local_energy_score = np.einsum("ij,ij->i", mtx[codes], freq)
+    energy_gain = local_energy_score - interface_energy[codes]
+    iupred_scores = moving_average(np.asarray(iupred_scores, dtype=float), iupred_window_size)
+    energy_gain = moving_average(moving_average(energy_gain, local_smoothing_window), local_smoothing_window)
+
+    sign = np.where((energy_gain < par_b) & (iupred_scores < par_c), -1, 1)
+    with np.errstate(divide="ignore", over="ignore"):
+        corr = np.where((iupred_scores > iupred_limit) & (energy_gain < 0),
+                        (par_a / (iupred_scores - par_c)) + par_b, 0)
+        anchor_score = sign * (energy_gain + corr - par_b) * (iupred_scores - par_c)
+        anchor_score = 1 / (1 + np.exp(-22.97968 * (anchor_score - 0.0116)))
+    return anchor_score
+
+
+Prediction = namedtuple("Prediction", ["iupred", "anchor", "glob"])
+
+
+def predict(seq, mode="long", anchor=False, params=None, reference=False):
+    """
+    Predict the disorder of a protein sequence.
+    Returns a Prediction with the IUPred2 scores array, the ANCHOR2
+    scores array (None unless anchor is set) and the globular domains
+    report (empty unless mode is glob).
+    """
+    if mode not in MODES:
+        raise ValueError("Wrong iupred2 option {}".format(mode))
+    if params is None:
+        params = load_parameters()
+    # The reference implementation is kept available for validation
+    predictor = iupred if reference else iupred_vectorized
+    binding_predictor = anchor2 if reference else anchor2_vectorized
+
+    seq = str(seq)
+    iupred_scores, glob_text = predictor(seq, mode, params)
+    anchor_scores = None
+    if anchor:
+        long_scores = iupred_scores if mode == "long" else predictor(seq, "long", params)[0]
+        anchor_scores = np.asarray(binding_predictor(seq, long_scores, params), dtype=float)
+    return Prediction(np.asarray(iupred_scores, dtype=float), anchor_scores, glob_text)
+
+
+def prediction_block(identifier, seq, mode, anchor=False, reference=False, params=None):
+    """
+    Return the text output of a single sequence prediction.
+    """
+    result = predict(seq, mode, anchor, params, reference)
+    # Print individual sequence identifier for posterior parsing
+    lines = [f">{identifier}"]
+    if mode == 'glob':
+        lines.append(result.glob)
+    if anchor:
+        lines.append("# POS\tRES\tIUPRED2\tANCHOR2")
+        for pos, residue in enumerate(seq):
+            lines.append('{}\t{}\t{:.4f}\t{:.4f}'.format(pos + 1, residue, result.iupred[pos], result.anchor[pos]))
+    else:
+        lines.append("# POS\tRES\tIUPRED2")
+        for pos, residue in enumerate(seq):
+            lines.append('{}\t{}\t{:.4f}'.format(pos + 1, residue, result.iupred[pos]))
+    return "\n".join(lines) + "\n"
+
+
+def _prediction_worker(task):
+    """
+    Pool worker, parameters are loaded once per process.
+    """
+    identifier, seq, mode, anchor, reference, path = task
+    return prediction_block(identifier, seq, mode, anchor, reference, load_parameters(path))
+
+
+def _score_worker(task):
+    """
+    Pool worker for the binary output, returns the score arrays.
+    """
+    identifier, seq, mode, anchor, reference, path = task
+    return identifier, predict(seq, mode, anchor, load_parameters(path), reference)
+
+
+def write_binary(filename, predictions):
+    """
+    Write (identifier, Prediction) pairs into a NPZ file holding the
+    concatenated float32 scores of all the sequences and an offsets
+    index, so that the scores of the i-th sequence in ids are
+    iupred[offsets[i]:offsets[i + 1]].
+    Scores are rounded to 4 decimals, the precision of the text output,
+    and stored as float32 as soon as each sequence is predicted.
+    """
+    ids = []
+    iupred_scores = []
+    anchor_scores = []
+    for identifier, result in predictions:
+        ids.append(identifier)
+        iupred_scores.append(np.round(result.iupred, 4).astype(np.float32))
+        if result.anchor is not None:
+            anchor_scores.append(np.round(result.anchor, 4).astype(np.float32))
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(scores) for scores in iupred_scores])
+    arrays = {
+        "ids": np.array(ids, dtype=str),
+        "offsets": offsets,
+        "iupred": np.concatenate(iupred_scores or [np.zeros(0, dtype=np.float32)]),
+    }
+    if anchor_scores:
+        arrays["anchor"] = np.concatenate(anchor_scores)
+    np.savez(filename, **arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="IUPred2A prediction of protein disorder and disordered binding regions",
+            usage="iupred2a.py (options) (seqfile) (iupred type)")
+    parser.add_argument("seqfile", help="Protein sequences in fasta format")
+    parser.add_argument("type", choices=["long", "short", "glob"], help="IUPred2 prediction type")
+    parser.add_argument("-d", dest="path", default=PATH,
+                        help="Location of data directory (default='./')")
+    parser.add_argument("-a", dest="anchor", action="store_true", help="Enable ANCHOR2 predition")
+    parser.add_argument("-r", dest="reference", action="store_true",
+                        help="Use the reference (pure Python) implementation")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes (default=1)")
+    parser.add_argument("-b", "--binary", metavar="FILE",
+                        help="Write the scores into a binary NPZ file instead of the text output")
+    args = parser.parse_args()
+    if not os.path.isfile(args.seqfile):
+        parser.error('Input sequence file not found at {}!'.format(args.seqfile))
+    if not os.path.isdir(os.path.join(args.path, 'data')):
+        parser.error('Data directory not found at {}!'.format(args.path))
+    # Model files are parsed once and shared by all the sequences
+    params = load_parameters(args.path)
+
+    sequences = SeqIO.parse(args.seqfile, "fasta")
+    tasks = ((sequence.id, str(sequence.seq), args.type, args.anchor, args.reference, args.path)
+             for sequence in sequences)
+    if args.binary:
+        if args.jobs > 1:
+            with Pool(args.jobs, initializer=load_parameters, initargs=(args.path,)) as pool:
+                write_binary(args.binary, pool.imap(_score_worker, tasks, chunksize=CHUNK_SIZE))
+        else:
+            write_binary(args.binary, map(_score_worker, tasks))
+        return
+
+    # Print output message with run parameters
+    print("""# IUPred2A: context-dependent prediction of protein disorder as a function of redox state and protein binding
 # Balint Meszaros, Gabor Erdos, Zsuzsanna Dosztanyi
 # Nucleic Acids Research 2018;46(W1):W329-W337.
 #
 # Prediction type: {}
-# Prediction output""".format(sys.argv[-1]))
-
-# Add SeqIO parser to support multiple sequences analysis simultaneously
-sequences = SeqIO.parse(sys.argv[-2], "fasta")
-for sequence in sequences:
-    # Print individual sequence identifier for posterior parsing
-    print(f">{sequence.id}")
+# Prediction output""".format(args.type))
 
-    iupred2_result = iupred(sequence, sys.argv[-1])
-    if '-a' in sys.argv:
-        if sys.argv[-1] == 'long':
-            anchor2_res = anchor2(sequence, iupred2_result[0])
-        else:
-            anchor2_res = anchor2(sequence, iupred(sequence, 'long')[0])
-    if sys.argv[-1] == 'glob':
-        print(iupred2_result[1])
-    if '-a' in sys.argv:
-        print("# POS\tRES\tIUPRED2\tANCHOR2")
+    if args.jobs > 1:
+        # Sequences are predicted in chunks and written back in input order
+        with Pool(args.jobs, initializer=load_parameters, initargs=(args.path,)) as pool:
+            for block in pool.imap(_prediction_worker, tasks, chunksize=CHUNK_SIZE):
+                sys.stdout.write(block)
     else:
-        print("# POS\tRES\tIUPRED2")
+        for sequence in sequences:
+            sys.stdout.write(prediction_block(sequence.id, str(sequence.seq), args.type,
+                                              args.anchor, args.reference, params))
+
 
-    for pos, residue in enumerate(sequence):
-        print('{}\t{}\t{:.4f}'.format(pos + 1, residue, iupred2_result[0][pos]), end="")
-        if '-a' in sys.argv:
-            print("\t{:.4f}".format(anchor2_res[pos]), end="")
-        print()
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import glob
 
 SPECIES = [file.split('/')[-1].split('.')[0] for file in glob.glob('data/genomes/*')]
 PROTEOMES = [file.split('/')[-1].split('.')[0] for file in glob.glob('data/proteomes/*')]
+# Number of query shards scanned in parallel by hmmscan
+SHARDS = 8
 
 #SPECIES = ['NC_001623', 'NC_008348']
 
@@ -16,27 +18,17 @@ rule CDS_prediction:
     temp("data/proteomes/{specie}.CDS.fasta")
   shell:
     """
-    bin/ORFfinder -in {input} -out {output} -s 0 -ml 150 -n t -c t
+    scripts/orf_finder.py -in {input} -out {output} -s 0 -ml 150 -n t -c t
     """
 
 rule aggregate_predicted_CDS:
   input:
     expand("data/proteomes/{species}.CDS.fasta", species=SPECIES)
-  output:
-    temp("results/raw_predicted_CDS.faa")
-  shell:
-    """
-    cat {input} > {output}
-    """
-
-rule rename_predicted_CDS:
-  input:
-    "results/raw_predicted_CDS.faa"
   output:
     temp("results/predicted_CDS.faa")
   shell:
     """
-    scripts/rename_predicted_CDS.py {input} > {output}
+    cat {input} > {output}
     """
 
 rule aggregate_annotated_CDS:
@@ -57,20 +49,41 @@ rule merge_CDS:
     "results/baculovirus_CDS.faa"
   shell:
     """
-    scripts/annotate_CDS.py {input} {output}
+    scripts/annotate_CDS.py --per-genome --cache-dir results/merge_cache {input} {output}
+    """
+
+rule shard_CDS:
+  input:
+    "results/baculovirus_CDS.faa"
+  output:
+    temp(expand("results/shards/CDS_{shard}.faa", shard=range(SHARDS)))
+  shell:
+    """
+    scripts/shard_fasta.py {input} -o {output}
+    """
+
+rule pfam_annotation_shard:
+  input:
+    seq="results/shards/CDS_{shard}.faa",
+    db="data/Pfam/Pfam-A.hmm",
+  output:
+    temp("results/shards/CDS-space_annotation_{shard}.tbl")
+  threads:
+      1
+  shell:
+    """
+    hmmscan --domtblout {output} -E 0.001 --domE 0.001 --cpu {threads} {input.db} {input.seq} > /dev/null
     """
 
 rule pfam_annotation:
   input:
     seq="results/baculovirus_CDS.faa",
-    db="data/Pfam/Pfam-A.hmm",
+    tables=expand("results/shards/CDS-space_annotation_{shard}.tbl", shard=range(SHARDS))
   output:
     "results/CDS-space_annotation.tbl"
-  threads:
-      4
   shell:
     """
-    hmmscan --domtblout {output} -E 0.001 --domE 0.001 --cpu {threads} {input.db} {input.seq}
+    scripts/merge_hmmscan.py --domtbl {input.seq} {input.tables} -o {output}
     """
 
 rule disembl_annotation:
@@ -94,5 +107,5 @@ rule iupred2a_annotation:
       4
   shell:
     """
-    bin/iupred2a.py -a {input} long > {output}
+    bin/iupred2a.py -a --jobs {threads} {input} long > {output}
     """
@@ -15,8 +15,7 @@ rule split_ORFomes:
       directory("results/ORFomes/")
     shell:
         """
-        scripts/split_ORFomes.py {input} &&\
-        mv NC_*.faa {output}
+        scripts/split_ORFomes.py {input} -o {output}
         """
 
 rule run_orthofinder:
@@ -42,18 +41,33 @@ rule create_hmm_database:
         "results/Orthogroup_Sequences",
         min_numer=6,
         name='hmm_db'
+    threads:
+        4
     shell:
-        "python3 scripts/create_hmm_database.py {params} > {output}"
+        "python3 scripts/create_hmm_database_orthofinder.py {params} --jobs {threads} --cache-dir results/hmm_cache > {output}"
+
+rule hmmer_search_shard:
+    input:
+        seqdb="results/shards/CDS_{shard}.faa",
+        hmmfile="results/hmm_db"
+    output:
+        temp("results/shards/hmm_search_{shard}.tab")
+    threads:
+        1
+    shell:
+        """
+        hmmscan --tblout {output} -E 0.001 --domE 0.001 --cpu {threads} {input.hmmfile} {input.seqdb} > /dev/null
+        """
 
 rule hmmer_search:
     input:
         seqdb="results/baculovirus_CDS.faa",
-        hmmfile="results/hmm_db"
+        tables=expand("results/shards/hmm_search_{shard}.tab", shard=range(SHARDS))
     output:
         "results/hmm_search.tab"
     shell:
         """
-        hmmscan --tblout {output} -E 0.001 --domE 0.001 {input.hmmfile} {input.seqdb}
+        scripts/merge_hmmscan.py {input.seqdb} {input.tables} -o {output}
         """
 
 rule hmmer_report:
@@ -1,46 +1,56 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
 import subprocess
-from Bio import SearchIO
+from pathlib import Path
 from Bio import SeqIO
+from sequence_store import SequenceStore
 
 
-def diamond_search(query, database):
+def diamond_search(query, database, output="tmp.tsv", db="tmp.db", max_targets=1, dbsize=None):
     """
     Builds a BLAST database and performs a BLASTp search
-    againts query sequences.
+    againts query sequences. Hits are reported in tabular
+    format (outfmt 6), only the best max_targets ones for
+    each query (0 reports every target). E-values are computed
+    for a database of dbsize residues when given, instead of
+    the size of the searched database. Raises CalledProcessError
+    if diamond fails.
     """
 
     # Database build
-    build_db = f'diamond makedb --in {database} --db tmp.db'
+    build_db = f'diamond makedb --in {database} --db {db}'
     # Perform search
-    run_diamond = f'diamond blastp --threads 4 --query {query} --db tmp.db --outfmt 5 --out tmp.xml'
-    subprocess.run(build_db, shell=True)
-    subprocess.run(run_diamond, shell=True)
+    run_diamond = f'diamond blastp --threads 4 --query {query} --db {db} --outfmt 6 qseqid sseqid --max-target-seqs {max_targets} --out {output}'
+    if dbsize is not None:
+        run_diamond += f' --dbsize {dbsize}'
+    subprocess.run(build_db, shell=True, check=True)
+    subprocess.run(run_diamond, shell=True, check=True)
 
 
-def retrieve_new_cds(multifasta, blast_search):
+def read_hit_ids(blast_search):
     """
-    Takes the results from a BLASTp search and return the CDS id for
-    the queries without any hit.
+    Stream a tabular (outfmt 6) BLASTp search and return the set
+    of query identifiers with at least one hit.
     """
 
-    search = SearchIO.parse(blast_search, 'blast-xml')
-    # Collect identifiers from BLASTp result
-    new_cds_id = []
-    for query in search:
-        # Only retain sequences without hits
-        if not query.hits:
-            new_cds_id.append(query.id)
-    # Extract sequences from multifasta
-    new_cds = {}
-    seqs = SeqIO.parse(multifasta, "fasta")
-    for seq in seqs:
-        # Only sequences not identified in BLASTp
-        if seq.id in new_cds_id:
-            new_cds[seq.id] = seq.seq
-    return new_cds
+    with open(blast_search, "r") as fh:
+        return {line.split("\t", 1)[0].rstrip("\n") for line in fh if line.strip()}
+
+
+def retrieve_new_cds(multifasta, hit_ids):
+    """
+    Takes the query identifiers with hits in a BLASTp search and yield
+    the CDS id and sequence for the queries without any hit, in
+    multifasta order.
+    """
+
+    # Extract sequences from multifasta, only retaining sequences without hits
+    with SequenceStore(multifasta) as seqs:
+        for identifier in seqs:
+            if identifier not in hit_ids:
+                yield identifier, seqs.fetch(identifier)
 
 
 def update_proteome(cds, proteome, output):
@@ -52,29 +62,169 @@ def update_proteome(cds, proteome, output):
     seqs = SeqIO.parse(proteome, "fasta")
     # Compute new CDS
     diamond_search(cds, proteome)
-    new_cds = retrieve_new_cds(cds, "tmp.xml")
+    new_cds = retrieve_new_cds(cds, read_hit_ids("tmp.tsv"))
     # Write an updated proteome to output file
     with open(output, "w") as fh:
         for seq in seqs:
             fh.write(f">{seq.id}\n{seq.seq}\n")
-        for cds in new_cds:
-            fh.write(f">{cds}\n{new_cds[cds]}\n")
+        for identifier, sequence in new_cds:
+            fh.write(f">{identifier}\n{sequence}\n")
+
+
+def genome_id(identifier):
+    """
+    Return the genome of a protein identifier.
+    lcl|NC_XXXXXX.1_prot_... -> lcl|NC_XXXXXX.1
+    """
+    return identifier.split("_prot_")[0]
+
+
+def genome_pieces(multifasta, cache_dir):
+    """
+    Split a multifasta into one file per genome, named after the
+    SHA-256 digest of its content, inside the cache directory.
+    Returns a dictionary with genomes as keys and digests as values.
+    """
+
+    pieces_dir = Path(cache_dir) / "sequences"
+    pieces_dir.mkdir(parents=True, exist_ok=True)
+    digests = {}
+    with SequenceStore(multifasta) as seqs:
+        genomes = {}
+        for identifier in seqs:
+            genomes.setdefault(genome_id(identifier), []).append(identifier)
+        for genome, identifiers in genomes.items():
+            records = "".join(f">{identifier}\n{seqs.fetch(identifier)}\n"
+                              for identifier in identifiers)
+            digest = hashlib.sha256(records.encode()).hexdigest()
+            piece = pieces_dir / f"{digest}.faa"
+            if not piece.exists():
+                piece.write_text(records)
+            digests[genome] = digest
+    return digests
+
+
+def total_residues(multifasta):
+    """
+    Return the total number of residues of a multifasta file.
+    """
+
+    with SequenceStore(multifasta) as seqs:
+        return sum(seqs.length(identifier) for identifier in seqs)
+
+
+def pair_file(cache_dir, query, target, dbsize):
+    """
+    Return the hits file of a (query genome, target genome) pair
+    searched with an effective database size of dbsize residues.
+    """
+
+    return Path(cache_dir) / "hits" / f"{query}_{target}_{dbsize}.txt"
+
+
+def concatenate_pieces(digests, cache_dir, output):
+    """
+    Write the genome pieces with the given digests into a single file.
+    """
+
+    with open(output, "w") as fh:
+        for digest in digests:
+            fh.write((Path(cache_dir) / "sequences" / f"{digest}.faa").read_text())
+
+
+def search_missing_pairs(queries, targets, cache_dir, dbsize):
+    """
+    Run BLASTp searches only for the (query genome, target genome)
+    pairs without cached results. Query genomes missing the same
+    targets are searched together, and the identifiers with hits are
+    stored per pair as hits/<query digest>_<target digest>_<dbsize>.txt
+    Every target is reported for each query, and E-values are always
+    computed for an effective database of dbsize residues (the whole
+    annotated proteome), so that the hits of each pair do not depend
+    on the other genomes searched with it. Pair files are only written
+    after diamond exits cleanly.
+    """
+
+    cache = Path(cache_dir)
+    hits_dir = cache / "hits"
+    hits_dir.mkdir(parents=True, exist_ok=True)
+    # Group query genomes by the targets they still have to be searched against
+    groups = {}
+    for query in queries.values():
+        missing = frozenset(target for target in targets.values()
+                            if not pair_file(cache, query, target, dbsize).exists())
+        if missing:
+            groups.setdefault(missing, []).append(query)
+
+    for missing, group in groups.items():
+        concatenate_pieces(group, cache, cache / "query.faa")
+        concatenate_pieces(missing, cache, cache / "database.faa")
+        diamond_search(cache / "query.faa", cache / "database.faa",
+                       output=cache / "hits.tsv", db=cache / "database", max_targets=0,
+                       dbsize=dbsize)
+        pair_hits = {(query, target): set() for query in group for target in missing}
+        with open(cache / "hits.tsv", "r") as fh:
+            for line in fh:
+                query_id, target_id = line.rstrip("\n").split("\t")[:2]
+                pair = (queries[genome_id(query_id)], targets[genome_id(target_id)])
+                pair_hits[pair].add(query_id)
+        for (query, target), hit_ids in pair_hits.items():
+            # Write then rename, so interrupted runs never leave partial results
+            hits_file = pair_file(cache, query, target, dbsize)
+            tmp_file = hits_file.with_suffix(".tmp")
+            tmp_file.write_text("".join(f"{hit_id}\n" for hit_id in sorted(hit_ids)))
+            tmp_file.replace(hits_file)
+    subprocess.run(f"rm -rf {cache}/query.faa {cache}/database* {cache}/hits.tsv", shell=True)
+
+
+def update_proteome_incremental(cds, proteome, output, cache_dir):
+    """
+    Same as update_proteome(), but searching each genome ORFs against
+    each annotated proteome separately and caching the results by
+    content. Only new or changed genomes are searched again, with
+    E-values scaled to the whole proteome as in update_proteome().
+    """
+
+    queries = genome_pieces(cds, cache_dir)
+    targets = genome_pieces(proteome, cache_dir)
+    dbsize = total_residues(proteome)
+    search_missing_pairs(queries, targets, cache_dir, dbsize)
+    # Collect identifiers with hits in any of the proteomes
+    hit_ids = set()
+    for query in queries.values():
+        for target in targets.values():
+            hit_ids |= read_hit_ids(pair_file(cache_dir, query, target, dbsize))
+    # Write an updated proteome to output file
+    with open(output, "w") as fh:
+        for seq in SeqIO.parse(proteome, "fasta"):
+            fh.write(f">{seq.id}\n{seq.seq}\n")
+        for identifier, sequence in retrieve_new_cds(cds, hit_ids):
+            fh.write(f">{identifier}\n{sequence}\n")
 
 
 def main():
     parser = argparse.ArgumentParser(
     description='Add non-annotated ORFs to a proteome based on BLASTp',
-    usage='annotate_predicted_CDS <query> <database> <output>')
+    usage='annotate_predicted_CDS [--per-genome] <query> <database> <output>')
 
     parser.add_argument('query', help='Query sequences in fasta format')
     parser.add_argument('database', help='Sequence to build the database')
     parser.add_argument('output', help='File output name')
+    parser.add_argument('--per-genome',
+                        action='store_true',
+                        help='Search each genome separately, reusing cached results')
+    parser.add_argument('--cache-dir',
+                        default='merge_cache',
+                        help='Directory for per-genome results (default: merge_cache)')
     args = parser.parse_args()
 
     # Run annotation
-    update_proteome(args.query, args.database, args.output)
-    # Clean intermediate files
-    subprocess.run("rm -rf tmp.db* tmp.xml", shell=True)
+    if args.per_genome:
+        update_proteome_incremental(args.query, args.database, args.output, args.cache_dir)
+    else:
+        update_proteome(args.query, args.database, args.output)
+        # Clean intermediate files
+        subprocess.run("rm -rf tmp.db* tmp.tsv", shell=True)
 
 
 if __name__ == '__main__':
@@ -3,14 +3,50 @@
 import argparse
 import subprocess
 import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from Bio import SeqIO
+from profile_builder import MAX_LENGTH, MAX_SEQS, build_profile
 
 
-def extract_sequences(groups_file, multifasta):
+def read_fasta(multifasta):
+    """
+    Stream a fasta file, yielding the identifier
+    and sequence of each record.
+    """
+
+    identifier = None
+    seq = []
+    with open(multifasta, "r") as fh:
+        for line in fh:
+            if line.startswith(">"):
+                if identifier is not None:
+                    yield identifier, "".join(seq)
+                identifier = line[1:].split(None, 1)[0]
+                seq = []
+            else:
+                seq.append(line.strip())
+    if identifier is not None:
+        yield identifier, "".join(seq)
+
+
+def write_group(filename, records):
+    """
+    Write the sequences of a group in a single buffered write.
+    """
+
+    with open(filename, "w") as fh:
+        fh.write("".join(f">{identifier}\n{seq}\n"
+                         for identifier, seq in records if seq is not None))
+
+
+def extract_sequences(groups_file, multifasta, jobs=1):
     """
     Extract the fasta sequences for each group and
     write them into a single file.
+    The multifasta is read once, each record being routed to
+    every group containing it. Identifiers missing from the
+    multifasta are reported on the standard error.
     """
 
     # Create a temporal directory to store sequences
@@ -21,43 +57,60 @@ def extract_sequences(groups_file, multifasta):
                   for line in fh
                   if len(line.split(",")) > 2}
 
-    # Store fasta sequences as a dictionary
-    seqs = SeqIO.to_dict(SeqIO.parse(multifasta, 'fasta'))
-    # For each protein group
-    for group in groups:
-        # Create a separate file
-        filename = directory / group
-        with open(filename, "w") as fh:
-            # Add sequences based on identifiers
-            for identifier in groups[group]:
-                seq = str(seqs[identifier].seq)
-                fh.write(f">{identifier}\n{seq}\n")
-
-
-def build_hmm_model(seqs):
+    # Store the (identifier, sequence) slots of each group, and the
+    # slots of each identifier across groups
+    records = {}
+    slots = {}
+    for group, identifiers in groups.items():
+        records[group] = [[identifier, None] for identifier in identifiers]
+        for record in records[group]:
+            slots.setdefault(record[0], []).append(record)
+    # Route the fasta sequences to their groups
+    for identifier, seq in read_fasta(multifasta):
+        for record in slots.get(identifier, ()):
+            record[1] = seq
+
+    # Report identifiers without sequence
+    missing = [identifier for identifier, group_slots in slots.items()
+               if group_slots[0][1] is None]
+    if missing:
+        print(f'{len(missing)} identifiers not found in {multifasta}: '
+              f'{", ".join(missing)}', file=sys.stderr)
+
+    # Write a separate file for each group
+    with ThreadPoolExecutor(max(jobs, 1)) as executor:
+        for _ in executor.map(lambda group: write_group(directory / group, records[group]),
+                              records):
+            pass
+
+
+def build_hmm_model(seqs, cache_dir=None, max_seqs=MAX_SEQS, max_length=MAX_LENGTH):
     """
     Builds a HMM models for a multifasta file.
     """
 
-    mafft_align = f'mafft --localpair --maxiterate 1000 {seqs} >> {seqs}.aln'
-    build_hmm = f'hmmbuild {seqs}.hmm {seqs}.aln'
-    subprocess.run(mafft_align, shell=True)
-    subprocess.run(build_hmm, shell=True)
+    error = build_profile(seqs, f'{seqs}.aln', f'{seqs}.hmm', cache_dir,
+                          max_seqs, max_length)
+    if error:
+        print(f'{Path(seqs).name}: {error}', file=sys.stderr)
 
 
-def build_hmm_database(db_name):
+def build_hmm_database(db_name, cache_dir=None, max_seqs=MAX_SEQS, max_length=MAX_LENGTH):
     '''
     Takes a CSV with sequence groups, extract the sequences from
     a multifasta, performs a multiple sequence alignment and
     prints a HMM database containing all models derived from the alignments.
+    Alignments and models are reused from the cache directory when given.
+    Groups larger than max_seqs sequences or max_length mean length are
+    aligned with FFT-NS-2 instead of L-INS-i.
     '''
 
     # Iterate over files in the temporal directory
     directory = Path.cwd() / "temporal"
-    files = Path.iterdir(directory)
+    files = list(Path.iterdir(directory))
     for file in files:
         # Build orthogroup alignments and HMM models
-        build_hmm_model(str(file))
+        build_hmm_model(str(file), cache_dir, max_seqs, max_length)
     # Merge all models into a single HMM database and compress it
     hmm_models = str(directory / "*.hmm")
     concatenate = f'cat {hmm_models} > {db_name}'
@@ -79,6 +132,21 @@ def main():
                         nargs='?',
                         default='hmm_db',
                         help='Output file name')
+    parser.add_argument('--cache-dir',
+                        default='hmm_cache',
+                        help='Directory to store and reuse group alignments and models')
+    parser.add_argument('--linsi-max-seqs',
+                        type=int,
+                        default=MAX_SEQS,
+                        help='Largest number of sequences aligned with L-INS-i')
+    parser.add_argument('--linsi-max-length',
+                        type=int,
+                        default=MAX_LENGTH,
+                        help='Largest mean sequence length aligned with L-INS-i')
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help='Number of group files written in parallel')
     args = parser.parse_args()
 
     # Check if a temporal directory exist
@@ -86,14 +154,14 @@ def main():
     if Path.exists(directory):
         # Delete previous temporal directory
         shutil.rmtree(directory)
-    else:
-        # Create temporal directory
-        Path.mkdir(directory)
+    # Create temporal directory
+    Path.mkdir(directory)
 
     # Extract fasta sequences groups
-    extract_sequences(args.groups, args.multifasta)
+    extract_sequences(args.groups, args.multifasta, args.jobs)
     # Build the HMM database
-    build_hmm_database(args.output)
+    build_hmm_database(args.output, args.cache_dir,
+                       args.linsi_max_seqs, args.linsi_max_length)
     # Clean temporal directory
     shutil.rmtree(directory)
 
@@ -1,30 +1,135 @@
 #!/usr/bin/env python3
 
 import argparse
-from Bio import SeqIO
 import os
 import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from profile_builder import MAX_LENGTH, MAX_SEQS, build_profile
 
 
-def sequences_number(seqfile, n_seq):
+def orthogroup_size(seqfile):
     """
-    Return the number of sequences in a fasta file.
+    Return the number of sequences and the total number
+    of residues of a multifasta file.
     """
-    sequences = list(SeqIO.parse(seqfile, 'fasta'))
-    return len(sequences) >= n_seq
+    count = residues = 0
+    with open(seqfile, 'rb') as fh:
+        for line in fh:
+            if line.startswith(b'>'):
+                count += 1
+            else:
+                residues += len(line.rstrip())
+    return count, residues
 
 
-def build_hmm_model(seqs):
+def write_manifest(files_dir, filename):
+    """
+    Write a tab separated manifest with the number of sequences
+    and total residues of each orthogroup in a directory.
+    """
+    manifest = {}
+    for file in sorted(os.listdir(files_dir)):
+        if file.endswith('.fa'):
+            manifest[file[:-3]] = orthogroup_size(os.path.join(files_dir, file))
+    with open(filename, 'w') as fh:
+        for orthogroup, (count, residues) in manifest.items():
+            fh.write(f'{orthogroup}\t{count}\t{residues}\n')
+    return manifest
+
+
+def read_manifest(filename):
+    """
+    Read an orthogroups manifest written by write_manifest().
+    """
+    manifest = {}
+    with open(filename, 'r') as fh:
+        for line in fh:
+            orthogroup, count, residues = line.rstrip('\n').split('\t')
+            manifest[orthogroup] = (int(count), int(residues))
+    return manifest
+
+
+def load_manifest(files_dir):
+    """
+    Return the orthogroups manifest of an OrthoFinder sequences
+    directory. The manifest is stored next to the directory
+    (<files_dir>_manifest.tsv) and only rebuilt when orthogroups
+    have been added, removed or modified after it was written.
+    """
+    filename = f'{os.path.abspath(files_dir)}_manifest.tsv'
+    if os.path.exists(filename):
+        manifest = read_manifest(filename)
+        written = os.path.getmtime(filename)
+        seqfiles = [os.path.join(files_dir, file) for file in os.listdir(files_dir)
+                    if file.endswith('.fa')]
+        if (len(seqfiles) == len(manifest) and
+                all(os.path.basename(seqfile)[:-3] in manifest and
+                    os.path.getmtime(seqfile) <= written for seqfile in seqfiles)):
+            return manifest
+    return write_manifest(files_dir, filename)
+
+
+def alignment_cost(seqfile, manifest=None):
+    """
+    Estimated cost of aligning an orthogroup. L-INS-i scales
+    with the square of the sequence number times their length,
+    i.e. the sequence number times the total residues. Sizes
+    are taken from the manifest when available.
+    """
+    orthogroup = os.path.basename(seqfile)[:-3]
+    if manifest and orthogroup in manifest:
+        count, residues = manifest[orthogroup]
+    else:
+        count, residues = orthogroup_size(seqfile)
+    return count * residues
+
+
+def build_hmm_model(seqs, cache_dir=None, max_seqs=MAX_SEQS, max_length=MAX_LENGTH):
     """
     Builds a HMM models for a multifasta file.
+    Returns the error message of the failed step, or None.
+    """
+    return build_profile(seqs, f'{seqs[:-3]}.aln', f'{seqs[:-3]}.hmm', cache_dir,
+                         max_seqs, max_length)
+
+
+def build_hmm_models(seqfiles, jobs=1, cache_dir=None, max_seqs=MAX_SEQS, max_length=MAX_LENGTH,
+                     manifest=None):
+    """
+    Builds the HMM models of several multifasta files on a pool
+    of workers, largest orthogroups first so that they do not
+    delay the end of the run (sizes from the orthogroups manifest,
+    when given). Progress is reported on the standard
+    error. Alignments and models are reused from the cache directory
+    when given, and orthogroups larger than max_seqs sequences or
+    max_length mean length are aligned with FFT-NS-2. Returns a dictionary with the failed files and their errors.
     """
-    mafft_align = f'mafft --localpair --maxiterate 1000 {seqs} >> {seqs[:-3]}.aln'
-    build_hmm = f'hmmbuild {seqs[:-3]}.hmm {seqs[:-3]}.aln'
-    subprocess.run(mafft_align, shell=True)
-    subprocess.run(build_hmm, shell=True)
+    # Schedule orthogroups by decreasing alignment cost
+    seqfiles = sorted(seqfiles, key=lambda seqfile: alignment_cost(seqfile, manifest),
+                      reverse=True)
+    failed = {}
+    with ThreadPoolExecutor(max(jobs, 1)) as executor:
+        futures = {executor.submit(build_hmm_model, seqfile, cache_dir,
+                                   max_seqs, max_length): seqfile
+                   for seqfile in seqfiles}
+        for done, future in enumerate(as_completed(futures), 1):
+            seqfile = futures[future]
+            name = os.path.basename(seqfile)[:-3]
+            try:
+                error = future.result()
+            except Exception as exception:
+                error = str(exception)
+            if error:
+                failed[seqfile] = error
+                print(f'[{done}/{len(seqfiles)}] {name} failed: {error}', file=sys.stderr)
+            else:
+                print(f'[{done}/{len(seqfiles)}] {name} done', file=sys.stderr)
+    return failed
 
 
-def create_hmm_database(files_dir, min_number, db_name):
+def create_hmm_database(files_dir, min_number, db_name, jobs=1, cache_dir=None,
+                        max_seqs=MAX_SEQS, max_length=MAX_LENGTH):
     '''
     Takes a directory path containing several multifasta files
     and prints a HMM database containing all models derived
@@ -33,12 +138,17 @@ def create_hmm_database(files_dir, min_number, db_name):
     process the multifasta.
     '''
     work_dir = os.path.abspath(files_dir)
-    files = os.listdir(files_dir)
+    # Select orthogroups with enough sequences
+    manifest = load_manifest(work_dir)
+    seqfiles = [os.path.join(work_dir, f'{orthogroup}.fa')
+                for orthogroup, (count, _) in manifest.items()
+                if count >= min_number]
     # Build orthogroup alignments and HMM models
-    for file in files:
-        seqfile = os.path.join(work_dir, file)
-        if seqfile.endswith('.fa') and sequences_number(seqfile, min_number):
-            build_hmm_model(seqfile)
+    failed = build_hmm_models(seqfiles, jobs, cache_dir, max_seqs, max_length, manifest)
+    if failed:
+        print(f'{len(failed)} of {len(seqfiles)} orthogroups failed, '
+              'the HMM database was not created', file=sys.stderr)
+        return False
     # Merge all models into a single HMM database and compress it
     concatenate = f'cat {work_dir}/*.hmm > {db_name}'
     compress = f'hmmpress {db_name}'
@@ -46,17 +156,25 @@ def create_hmm_database(files_dir, min_number, db_name):
     subprocess.run(concatenate, shell=True)
     subprocess.run(compress, shell=True)
     subprocess.run(export, shell=True)
+    return True
 
 
 def main():
     parser = argparse.ArgumentParser(
     description='Takes a directory path containing several multifasta files and creates a HMM database containing all models derived from sequence alignments',
-    usage='create_hmm_database <files_dir> <min_number> <output>')
+    usage='create_hmm_database <files_dir> <min_number> <output> [--jobs N] [--cache-dir DIR]')
     parser.add_argument('files_dir', help='Directory with multifasta files')
     parser.add_argument('number', type=int, help='Minimal number of sequences per file')
     parser.add_argument('output', help='Output file name')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of orthogroups processed in parallel')
+    parser.add_argument('--cache-dir', default='hmm_cache', help='Directory to store and reuse orthogroup alignments and models')
+    parser.add_argument('--linsi-max-seqs', type=int, default=MAX_SEQS, help='Largest number of sequences aligned with L-INS-i')
+    parser.add_argument('--linsi-max-length', type=int, default=MAX_LENGTH, help='Largest mean sequence length aligned with L-INS-i')
     args = parser.parse_args()
-    create_hmm_database(args.files_dir, args.number, args.output)
+    if not create_hmm_database(args.files_dir, args.number, args.output,
+                               args.jobs, args.cache_dir,
+                               args.linsi_max_seqs, args.linsi_max_length):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
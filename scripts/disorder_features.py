@@ -1,115 +1,239 @@
 #!/usr/bin/env python3
 
 import argparse
-import pandas as pd
-
-
-def longest_CD(values):
-    """
-    Return the sequence range for the longest continuous
-    disorder (CDl) subsequence.
-    """
-    # Filter residues with score equal or greater than 0.5
-    # and store its position index
-    dis_res = [index for index, res in enumerate(values)
-               if float(res) >= 0.5]
-    # Initialize longest CD region
-    CDl = []
-    # Counter to store partial results of each continuous region
-    c = []
-    # Iterate over disordered residues list
-    for i, j in zip(dis_res, dis_res[1:]):
-        # Check if residues are consecutive
-        if j - i == 1:
-            # Update counter
-            c.append(i)
-        # Not consecutive
-        else:
-            # Add last residue of the interval
-            c.append(i)
-            # Update CDl
-            if len(c) > len(CDl):
-                CDl = c
-            # Reset counter for the next interval
-            c = []
-    return CDl
+import csv
+import os
+import sys
+import numpy as np
+from Bio import SeqIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "bin"))
+import iupred2a
+
+
+def continuous_regions(values, threshold=0.5):
+    """
+    Run-length encode the residues with a score equal or greater
+    than threshold. Returns the start position and the length of
+    every continuous region, including the one ending the protein.
+    """
+    mask = np.asarray(values, dtype=float) >= threshold
+    # Region boundaries are the changes of the padded mask
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends - starts
+
+
+def longest_region(starts, lengths):
+    """
+    Return the start and length of the longest (first on ties)
+    continuous region, or None when there are no regions.
+    """
+    if not len(lengths):
+        return None
+    longest = np.argmax(lengths)
+    return starts[longest], lengths[longest]
 
 
 class DisorderFeatures:
-    def __init__(self, iupred, anchor):
+    def __init__(self, iupred, anchor, threshold=0.5):
         """
         Initializes with a list of IUPred2A and ANCHOR
-        predicted values.
+        predicted values. Scores are converted to arrays and
+        the continuous disordered regions (CD) are found once.
         """
-        self.iupred = iupred
-        self.anchor = anchor
+        self.iupred = np.asarray(iupred, dtype=float)
+        self.anchor = np.asarray(anchor, dtype=float)
+        self.starts, self.lengths = continuous_regions(self.iupred, threshold)
+        self.disordered = self.lengths.sum()
+        self.CDl = longest_region(self.starts, self.lengths)
+        self.anchor_l = longest_region(*continuous_regions(self.anchor))
 
     def disorder_content(self):
         """
-        Filter disordered residues with a predicted
-        value greater than 0.5 and compute average
-        disorder content
+        Disordered residues (predicted value equal or
+        greater than the threshold) percentage.
         """
-        # Filter residues with score equal or greater than 0.5
-        dis_res = [res for res in self.iupred if float(res) >= 0.5]
-        # Compute disordered fraction
-        dis_content = len(dis_res) / len(self.iupred) * 100
-        return dis_content
+        return self.disordered / len(self.iupred) * 100
 
     def CDl_fraction(self):
         """
-        Computes the protein percentage occupied by CDl.
+        Computes the protein percentage occupied by the
+        longest continuous disorder region (CDl).
         """
-        CDl = longest_CD(self.iupred)
-        CDl_fraction = len(CDl) / len(self.iupred) * 100
-        return CDl_fraction
+        return self.CDl_lenght() / len(self.iupred) * 100
 
     def CDl_lenght(self):
         """
         Returns CDl amino acid lenght.
         """
-        return len(longest_CD(self.iupred))
+        return self.CDl[1] if self.CDl else 0
 
     def CDl_position(self):
         """
         Return CDl centroid position in protein sequence.
         """
-        CDl = longest_CD(self.iupred)
-        if CDl:
-            return sum(CDl) / len(CDl)
-        else:
-            return 0
+        if self.CDl:
+            return self.CDl[0] + (self.CDl[1] - 1) / 2
+        return 0.0
 
     def anchor_position(self):
         """
         Return ANCHOR centroid position in protein sequence.
         """
-        anchor = longest_CD(self.anchor)
-        if anchor:
-            return sum(anchor) / len(anchor)
-        else:
-            return 0
+        if self.anchor_l:
+            return self.anchor_l[0] + (self.anchor_l[1] - 1) / 2
+        return 0.0
+
+    def CD_count(self):
+        """
+        Returns the number of continuous disorder regions.
+        """
+        return len(self.lengths)
+
+    def longest_lenghts(self, number):
+        """
+        Returns the lenghts of the longest CD regions,
+        padded with zeros up to number.
+        """
+        longest = np.zeros(number, dtype=int)
+        lengths = np.sort(self.lengths)[::-1][:number]
+        longest[:len(lengths)] = lengths
+        return longest
+
+    def lenght_histogram(self, edges):
+        """
+        Returns the number of CD regions with a lenght inside
+        each [edges[i], edges[i + 1]) bin, the last one unbounded.
+        Regions shorter than the first edge are not counted.
+        """
+        bins = np.searchsorted(edges, self.lengths, side="right") - 1
+        return np.bincount(bins[bins >= 0], minlength=len(edges))
+
+    def features(self):
+        """
+        Return all the disorder features of the protein.
+        """
+        return {
+                "Disorder_content": self.disorder_content(),
+                "LCPL": self.CDl_fraction(),
+                "CDl": self.CDl_lenght(),
+                "CDl_position": self.CDl_position(),
+                "ANCHOR_position": self.anchor_position(),
+                }
+
+
+class FeatureSet:
+    """
+    Disorder features requested for a run. Every threshold and
+    statistic is computed from the same score arrays and reported
+    as columns of a single wide table.
+    """
+
+    def __init__(self, thresholds=(0.5,), count=False, longest=0, edges=()):
+        self.thresholds = list(thresholds)
+        self.count = count
+        self.longest = longest
+        self.edges = sorted(edges)
+
+    def suffix(self, threshold):
+        """
+        Column suffix, only needed to tell several thresholds apart.
+        """
+        return f"_{threshold}" if len(self.thresholds) > 1 else ""
+
+    def columns(self):
+        """
+        Returns the feature column names.
+        """
+        columns = []
+        for threshold in self.thresholds:
+            suffix = self.suffix(threshold)
+            columns += [f"Disorder_content{suffix}", f"LCPL{suffix}",
+                        f"CDl{suffix}", f"CDl_position{suffix}"]
+            if self.count:
+                columns.append(f"CD_count{suffix}")
+            columns += [f"CD{rank}{suffix}" for rank in range(1, self.longest + 1)]
+            bounds = [f"{low}-{high - 1}" for low, high in zip(self.edges, self.edges[1:])]
+            bounds += [f"{edge}+" for edge in self.edges[-1:]]
+            columns += [f"CD_{bound}{suffix}" for bound in bounds]
+        columns.append("ANCHOR_position")
+        return columns
+
+    def compute(self, iupred, anchor):
+        """
+        Returns the feature values of a protein, in column order.
+        """
+        iupred = np.asarray(iupred, dtype=float)
+        anchor = np.asarray(anchor, dtype=float)
+        values = []
+        for threshold in self.thresholds:
+            handle = DisorderFeatures(iupred, anchor, threshold)
+            features = handle.features()
+            values += [features["Disorder_content"], features["LCPL"],
+                       features["CDl"], features["CDl_position"]]
+            if self.count:
+                values.append(handle.CD_count())
+            if self.longest:
+                values += handle.longest_lenghts(self.longest).tolist()
+            if self.edges:
+                values += handle.lenght_histogram(self.edges).tolist()
+        values.append(features["ANCHOR_position"])
+        return values
 
 
 def parse_iupred2a(output):
     """
-    Parse IUPRED2A output into a dictionary with
-    IUPRED2A and ANCHOR predictions.
+    Parse IUPRED2A output, yielding one protein at a time as
+    (identifier, IUPRED2A predictions, ANCHOR predictions) tuples.
+    Only the protein being read is kept in memory.
     """
 
-    predictions = {}
+    identifier = None
+    iupred, anchor = [], []
     with open(output, "r") as fh:
         for line in fh:
             if line.startswith(">"):
+                if identifier is not None:
+                    yield identifier, iupred, anchor
                 identifier = line.strip()[1:]
-                predictions[identifier] = {
-                                    "iupred2a": [],
-                                    "anchor": []
-                        }
-            if line[0] not in [">", "#"]:
-                predictions[identifier]["iupred2a"].append(line.split()[2])
-                predictions[identifier]["anchor"].append(line.split()[3])
-    return predictions
+                iupred, anchor = [], []
+            elif line[0] != "#":
+                fields = line.split()
+                iupred.append(fields[2])
+                anchor.append(fields[3])
+    if identifier is not None:
+        yield identifier, iupred, anchor
+
+
+def load_iupred2a_binary(output):
+    """
+    Load the binary (NPZ) output of IUPRED2A, yielding the same
+    tuples as parse_iupred2a(). Scores are views into the
+    concatenated arrays, no per-residue objects are created.
+    """
+
+    data = np.load(output)
+    offsets = data["offsets"]
+    iupred = data["iupred"]
+    anchor = data["anchor"] if "anchor" in data.files else np.zeros_like(iupred)
+    for index, identifier in enumerate(data["ids"]):
+        start, end = offsets[index], offsets[index + 1]
+        yield str(identifier), iupred[start:end], anchor[start:end]
+
+
+def predict_iupred2a(fasta):
+    """
+    Run IUPred2A (long) and ANCHOR2 in-process over a fasta file,
+    yielding the same tuples as parse_iupred2a().
+    """
+
+    params = iupred2a.load_parameters()
+    for seq in SeqIO.parse(fasta, "fasta"):
+        result = iupred2a.predict(seq.seq, "long", anchor=True, params=params)
+        # Round as the text output so both inputs give the same features
+        yield seq.id, np.round(result.iupred, 4), np.round(result.anchor, 4)
 
 
 # def parse_disembl(output):
@@ -133,45 +257,24 @@ def parse_iupred2a(output):
 #    return predictions
 
 
-def compute_features(predictions):
+def compute_features(predictions, output="tmp", feature_set=None):
     """
     Generates a CSV file with disorder features for each
-    protein present in the input file.
+    protein present in the input stream. Rows are written
+    as soon as each protein is processed.
     """
 #    if predictor == "iupred2a":
-    features = {
-            "Protein": [],
-            "Disorder_content": [],
-            "LCPL": [],
-            "CDl": [],
-            "CDl_position": [],
-            "ANCHOR_position": [],
-            }
-    for key in predictions:
-        protein_id = "_".join(key.split("_")[3:5])
-
-        # Create DisorderFeatures instance
-        iupred = predictions[key]["iupred2a"]
-        anchor = predictions[key]["anchor"]
-        handle = DisorderFeatures(iupred, anchor)
-
-        # Compute features
-        dis_content = handle.disorder_content()
-        LCPL = handle.CDl_fraction()
-        CDl = handle.CDl_lenght()
-        CDl_position = handle.CDl_position()
-        ANCHOR_position = handle.anchor_position()
-
-        # Store features
-        features["Protein"].append(protein_id)
-        features["Disorder_content"].append(dis_content)
-        features["LCPL"].append(LCPL)
-        features["CDl"].append(CDl)
-        features["CDl_position"].append(CDl_position)
-        features["ANCHOR_position"].append(ANCHOR_position)
-    df = pd.DataFrame(features)
-    df.set_index("Protein")
-    df.to_csv("tmp", index=False)
+    if feature_set is None:
+        feature_set = FeatureSet()
+    header = ["Protein"] + feature_set.columns()
+    with open(output, "w", newline="") as fh:
+        writer = csv.writer(fh, lineterminator="\n")
+        writer.writerow(header)
+        for key, iupred, anchor in predictions:
+            protein_id = "_".join(key.split("_")[3:5])
+
+            # Compute all features in a single pass
+            writer.writerow([protein_id] + feature_set.compute(iupred, anchor))
 
 #    if predictor == "disembl":
 #        features = {
@@ -202,13 +305,38 @@ def main():
     Command line argument parser
     """
     parser = argparse.ArgumentParser(
-            usage="python3 disorder_features.py <output>",
+            usage="python3 disorder_features.py [--fasta] <output>",
             description="""
             Compute disorder features from IUPRED2A predictions
             """,
             epilog=""
     )
-    parser.add_argument("output", help="Output file")
+    parser.add_argument("output", help="Output file (text or binary .npz)")
+    parser.add_argument("-o",
+                        "--outfile",
+                        default="tmp",
+                        help="Features CSV file (default: tmp)")
+    parser.add_argument("-t",
+                        "--thresholds",
+                        nargs="+",
+                        type=float,
+                        default=[0.5],
+                        help="Disorder score thresholds (default: 0.5)")
+    parser.add_argument("--count",
+                        action="store_true",
+                        help="Report the number of continuous disorder regions")
+    parser.add_argument("--longest",
+                        type=int,
+                        default=0,
+                        help="Report the lenghts of the N longest regions")
+    parser.add_argument("--bins",
+                        nargs="+",
+                        type=int,
+                        default=[],
+                        help="Region lenght histogram bin edges")
+    parser.add_argument("--fasta",
+                        action="store_true",
+                        help="Input is a fasta file, run IUPred2A in-process")
 #    parser.add_argument("program",
 #                        type=str,
 #                        choices=["iupred2a", "disembl"],
@@ -218,8 +346,14 @@ def main():
 #        predictions = parse_iupred2a(args.output)
 #    elif args.program == "disembl":
 #        predictions = parse_disembl(args.output)
-    predictions = parse_iupred2a(args.output)
-    compute_features(predictions)
+    if args.fasta:
+        predictions = predict_iupred2a(args.output)
+    elif args.output.endswith(".npz"):
+        predictions = load_iupred2a_binary(args.output)
+    else:
+        predictions = parse_iupred2a(args.output)
+    feature_set = FeatureSet(args.thresholds, args.count, args.longest, args.bins)
+    compute_features(predictions, args.outfile, feature_set)
 
 
 if __name__ == "__main__":
@@ -5,32 +5,32 @@ import sys
 import pandas as pd
 
 
-def extract_pfam_groups(interpro_search):
+def extract_pfam_groups(interpro_search, chunksize=100000):
     """
     Extract the Pfam instances present in a InterPro
     results file (TSV) and groups the sequences that
     shares the same Pfam domain.
     Output goes to the file 'pfam_groups.csv'
+    The file is read in chunks of rows, only loading
+    the protein, database and instance columns.
     """
 
-    # Define column names
-    column_names = [
-            "Protein", "Hash", "Length", "DB",
-            "DB_instance", "Name", "Start", "End",
-            "E-value", "Date", "Description"
-            ]
-    # Create DataFrame with InterPro results
-    df = pd.read_csv(interpro_search,
-                     sep="\t",
-                     names=column_names)
-    # Keep only Pfam instances
-    pfam = df[df.loc[:, "DB"] == "Pfam"]
-    # Group using Pfam identifier
-    groups = pfam.groupby("DB_instance")
-    # Recover protein groups
-    protein_groups = {label: group.Protein.to_list()
-                      for label, group in groups}
-    for label in protein_groups:
+    # Read only Protein, DB and DB_instance columns
+    chunks = pd.read_csv(interpro_search,
+                         sep="\t",
+                         header=None,
+                         usecols=[0, 3, 4],
+                         names=["Protein", "DB", "DB_instance"],
+                         dtype="category",
+                         chunksize=chunksize)
+    # Store proteins of each Pfam identifier, without duplicates
+    protein_groups = {}
+    for chunk in chunks:
+        # Keep only Pfam instances
+        pfam = chunk[chunk["DB"] == "Pfam"]
+        for label, protein in zip(pfam["DB_instance"], pfam["Protein"]):
+            protein_groups.setdefault(label, {})[protein] = None
+    for label in sorted(protein_groups):
         proteins = ",".join(protein_groups[label])
         print(f"{label},{proteins}")
 
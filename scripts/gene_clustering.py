@@ -1,78 +1,193 @@
 #!/usr/bin/env python3
 
-from Bio import SearchIO
 import argparse
 
 
-def gene_clustering(hmmer_search, reference_names):
+def query_hits(hmmer_search, domtbl=False):
     '''
-    Complete orthogroups using the results from a hhmscan search
-    against a HMM profiles database created with OrthoFinder
-    orthogroups.
+    Stream a hmmscan tabular output (--tblout, or --domtblout when
+    domtbl is set) and yield each query with the list of its hits
+    in the file order (best hit first). Hits are (profile, bit score,
+    profile coverage) tuples, the coverage being the fraction of the
+    profile covered by the domains, or None for --tblout outputs.
+    hmmscan reports the hits of each query together, so only one
+    query is kept in memory.
     '''
 
-    # Load hhmsearch results
-    search = list(SearchIO.parse(hmmer_search, 'hmmer3-tab'))
-    # Initialize a dict to store the results
-    orthogroups = {}
-    # Iterate over all query proteins
-    for query in search:
-        # Retrieve the best hit (Orthogroup) in the database for the query
-        try:
-            hit_id = query[0].id
-            # If the orthogroup doesn't exist , create it and store results
-            if hit_id not in orthogroups.keys():
-                orthogroups[hit_id] = {'protein_id': [query.id]}
-            # If the orthogroup exists, only append results
-            elif hit_id in orthogroups.keys():
-                orthogroups[hit_id]['protein_id'].append(query.id)
-        # Handle queries without hits
-        except IndexError:
-            pass
-
-    # Create a dict containing AcMNPV reference gene names
-    with open(reference_names, "r") as f:
-        next(f)
-        reference_gene = {line.split(",")[1]: line.rstrip().split(",")[2]
-                          for line in f if line.startswith("acmnpv")}
-    # Create a dict containing CpGV gene names
+    # Query name and full sequence bit score columns
+    query_col, score_col = (3, 7) if domtbl else (2, 5)
+    query = None
+    hits = {}
+    with open(hmmer_search, "r") as fh:
+        for line in fh:
+            if line.startswith("#"):
+                continue
+            fields = line.split()
+            if fields[query_col] != query:
+                if hits:
+                    yield query, profile_hits(hits, domtbl)
+                query = fields[query_col]
+                hits = {}
+            hit = hits.setdefault(fields[0], [float(fields[score_col]), 0, []])
+            if domtbl:
+                # Profile length and domain coordinates in the profile
+                hit[1] = int(fields[2])
+                hit[2].append((int(fields[15]), int(fields[16])))
+    if hits:
+        yield query, profile_hits(hits, domtbl)
+
+
+def profile_hits(hits, domtbl):
+    '''
+    Return the (profile, bit score, coverage) tuples of the hits
+    of a query.
+    '''
+
+    results = []
+    for profile, (score, length, domains) in hits.items():
+        coverage = None
+        if domtbl:
+            # Length of the union of the domain intervals
+            covered, end = 0, 0
+            for start, stop in sorted(domains):
+                if stop > end:
+                    covered += stop - max(start, end + 1) + 1
+                    end = stop
+            coverage = covered / length
+        results.append((profile, score, coverage))
+    return results
+
+
+def read_cutoffs(cutoffs):
+    '''
+    Read per-profile bit score cutoffs, a whitespace separated
+    file with profile names and scores (# for comments).
+    '''
+
+    thresholds = {}
+    with open(cutoffs, "r") as f:
+        for line in f:
+            fields = line.split()
+            if fields and not fields[0].startswith("#"):
+                thresholds[fields[0]] = float(fields[1])
+    return thresholds
+
+
+def assign_query(hits, cutoffs=None, min_score=None, min_coverage=0, tie_margin=None):
+    '''
+    Return the orthogroup of a query and the other orthogroups it
+    could be assigned to. Hits must reach the profile bit score
+    cutoff (min_score for profiles without one) and cover at least
+    min_coverage of the profile. The best passing hit is assigned,
+    and the other passing hits (within tie_margin bits of it, when
+    given) are reported as ambiguous.
+    '''
+
+    passing = []
+    for profile, score, coverage in hits:
+        cutoff = cutoffs.get(profile, min_score) if cutoffs else min_score
+        if cutoff is not None and score < cutoff:
+            continue
+        if coverage is not None and coverage < min_coverage:
+            continue
+        passing.append((profile, score))
+    if not passing:
+        return None, []
+    best, best_score = passing[0]
+    ambiguous = [profile for profile, score in passing[1:]
+                 if tie_margin is None or best_score - score <= tie_margin]
+    return best, ambiguous
+
+
+def reference_index(reference_names):
+    '''
+    Read the reference gene names in one pass. Returns a dict with
+    protein accessions as keys and (is AcMNPV, gene name) as values,
+    AcMNPV names taking precedence over other species names.
+    '''
+
+    index = {}
     with open(reference_names, "r") as f:
         next(f)
-        cpgv_genes = {line.split(",")[1]: line.rstrip().split(",")[2]
-                      for line in f if line.startswith("other")}
-
-    # Rename orthogroups using the reference gene names
-    for key in orthogroups:
-        for protein in orthogroups[key]["protein_id"]:
-            # Check if any protein inside the orthogroup has a reference name
-            protein_id = "_".join(protein.split("_")[3:5])
-            if protein_id in reference_gene.keys():
-                orthogroups[key]["gene"] = reference_gene[protein_id]
-                break
-            elif protein_id in cpgv_genes.keys():
-                orthogroups[key]["gene"] = cpgv_genes[protein_id]
-            elif "gene" not in orthogroups[key]:
-                orthogroups[key]["gene"] = None
+        for line in f:
+            fields = line.rstrip().split(",")
+            if fields[0].startswith("acmnpv"):
+                index[fields[1]] = (True, fields[2])
+            elif fields[0].startswith("other") and not index.get(fields[1], (False,))[0]:
+                index[fields[1]] = (False, fields[2])
+    return index
+
+
+def assignments(hmmer_search, domtbl=False, cutoffs=None, min_score=None,
+                min_coverage=0, tie_margin=None):
+    '''
+    Stream the query proteins assigned by assign_query(), yielding
+    their protein and specie identifiers, orthogroup and ambiguous
+    orthogroups.
+    '''
+
+    for query, hits in query_hits(hmmer_search, domtbl):
+        orthogroup, ambiguous = assign_query(hits, cutoffs, min_score,
+                                             min_coverage, tie_margin)
+        if orthogroup is None:
+            continue
+        # Extract protein and specie identifier
+        fields = query.split("_")
+        yield "_".join(fields[3:5]), "NC_" + "_".join(fields[1:2]), orthogroup, ambiguous
+
+
+def gene_clustering(hmmer_search, reference_names, domtbl=False, cutoffs=None,
+                    min_score=None, min_coverage=0, tie_margin=None):
+    '''
+    Complete orthogroups using the results from a hhmscan search
+    against a HMM profiles database created with OrthoFinder
+    orthogroups. Queries are assigned by assign_query(), those
+    matching several orthogroups list the others in the Ambiguous
+    column.
+    The search is streamed twice, first to name the orthogroups
+    and then to print the rows, in the search order.
+    '''
+
+    # Reference gene names of proteins
+    names = reference_index(reference_names)
+    settings = (domtbl, cutoffs, min_score, min_coverage, tie_margin)
+
+    # Name each orthogroup after the AcMNPV name of its first AcMNPV
+    # protein, or else after the name of its last protein from another
+    # reference species
+    gene_clusters = {}
+    acmnpv_named = set()
+    for protein_id, _, orthogroup, _ in assignments(hmmer_search, *settings):
+        gene_clusters.setdefault(orthogroup, None)
+        if protein_id in names and orthogroup not in acmnpv_named:
+            is_acmnpv, name = names[protein_id]
+            gene_clusters[orthogroup] = name
+            if is_acmnpv:
+                acmnpv_named.add(orthogroup)
 
     # Results to standard output
-    print("Protein,Specie,Orthogroup,Gene_Cluster")
-    for key in orthogroups:
-        for protein in orthogroups[key]["protein_id"]:
-            # Extract protein and specie identifier
-            protein_id = "_".join(protein.split("_")[3:5])
-            specie = "NC_" + "_".join(protein.split("_")[1:2])
-            gene_cluster = orthogroups[key]["gene"]
-            print(f"{protein_id},{specie},{key},{gene_cluster}")
+    print("Protein,Specie,Orthogroup,Gene_Cluster,Ambiguous")
+    for protein_id, specie, orthogroup, ambiguous in assignments(hmmer_search, *settings):
+        print(f"{protein_id},{specie},{orthogroup},{gene_clusters[orthogroup]},{';'.join(ambiguous)}")
 
 
 def main():
     parser = argparse.ArgumentParser(
             description='Returns a csv file with the HMMER search results.',
-            usage='parse_hmmer-tab <hmmer> <reference_genes>')
+            usage='parse_hmmer-tab <hmmer> <reference_genes> [--domtbl] [--cutoffs FILE] [--min-coverage F]')
     parser.add_argument('hmmer', type=str, help='HMMER search in tab format')
     parser.add_argument('references', type=str, help='Reference names (CSV)')
+    parser.add_argument('-d', '--domtbl', action='store_true', help='HMMER search in domain table format (--domtblout)')
+    parser.add_argument('-c', '--cutoffs', type=str, help='Per-profile bit score cutoffs')
+    parser.add_argument('-s', '--min-score', type=float, help='Bit score cutoff for profiles without one')
+    parser.add_argument('--min-coverage', type=float, default=0, help='Minimal fraction of the profile covered by the domains (requires --domtbl)')
+    parser.add_argument('--tie-margin', type=float, help='Only report as ambiguous the hits within this bit score of the best one')
     args = parser.parse_args()
-    gene_clustering(args.hmmer, args.references)
+    if args.min_coverage and not args.domtbl:
+        parser.error('--min-coverage requires a domain table (--domtbl)')
+    cutoffs = read_cutoffs(args.cutoffs) if args.cutoffs else None
+    gene_clustering(args.hmmer, args.references, args.domtbl, cutoffs,
+                    args.min_score, args.min_coverage, args.tie_margin)
 
 
 if __name__ == '__main__':
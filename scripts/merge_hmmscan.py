@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import argparse
+import heapq
+import sys
+from sequence_store import load_index
+from shard_fasta import assign_shards
+
+
+def query_blocks(table, column, ranks):
+    """
+    Yield the (query rank, lines) blocks of a hmmscan tabular
+    output, in file order. Comment lines are skipped.
+    """
+
+    query = None
+    lines = []
+    with open(table, "r") as fh:
+        for line in fh:
+            if line.startswith("#"):
+                continue
+            name = line.split(None, column + 1)[column]
+            if name != query:
+                if lines:
+                    yield ranks[query], lines
+                query = name
+                lines = []
+            lines.append(line)
+    if lines:
+        yield ranks[query], lines
+
+
+def comments(table):
+    """
+    Return the header (column names, up to the dashes line) and the
+    footer (search summary) comment lines of a hmmscan tabular output.
+    """
+
+    header, footer = [], []
+    with open(table, "r") as fh:
+        for line in fh:
+            if not line.startswith("#"):
+                continue
+            if header and header[-1].startswith("#-"):
+                footer.append(line)
+            else:
+                header.append(line)
+    return header, footer
+
+
+def merge_hmmscan(multifasta, tables, domtbl=False, output=None):
+    """
+    Merge the hmmscan tabular outputs of the shards made by
+    shard_fasta.py, restoring the query order of the original
+    multifasta. Comment lines come from the shard holding its first
+    sequence, as in an unsharded run.
+    """
+
+    index = load_index(multifasta)
+    ranks = {identifier: rank for rank, identifier in enumerate(index)}
+    # Query name column, --tblout (3rd) or --domtblout (4th)
+    column = 3 if domtbl else 2
+    first = assign_shards(index, len(tables))[next(iter(index))] if index else 0
+    header, footer = comments(tables[first])
+
+    fh = open(output, "w") if output else sys.stdout
+    fh.writelines(header)
+    blocks = [query_blocks(table, column, ranks) for table in tables]
+    for _, lines in heapq.merge(*blocks, key=lambda block: block[0]):
+        fh.writelines(lines)
+    fh.writelines(footer)
+    if output:
+        fh.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Merges the hmmscan tabular outputs of multifasta shards in the original query order',
+        usage='merge_hmmscan.py <multifasta> <tables> [--domtbl] [-o <output>]')
+    parser.add_argument('multifasta', help='Unsharded fasta sequences file')
+    parser.add_argument('tables', nargs='+', help='hmmscan outputs, in shard order')
+    parser.add_argument('-d', '--domtbl', action='store_true', help='Tables are --domtblout outputs')
+    parser.add_argument('-o', '--output', help='Output file (default: standard output)')
+    args = parser.parse_args()
+    merge_hmmscan(args.multifasta, args.tables, args.domtbl, args.output)
+
+
+if __name__ == '__main__':
+    main()
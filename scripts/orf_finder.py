@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Bio import SeqIO
+
+BASES = "ACGT"
+# Standard genetic code (NCBI table 1), codons in TCAG order
+CODE = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+# Nucleotides as 0-3 (ACGT), anything else as 4
+NUCLEOTIDES = np.full(256, 4, dtype=np.int64)
+for _index, _base in enumerate(BASES):
+    NUCLEOTIDES[ord(_base)] = NUCLEOTIDES[ord(_base.lower())] = _index
+# Amino acid for each codon index (16 * b1 + 4 * b2 + b3), 64 for unknown codons
+TABLE = np.full(65, ord("X"), dtype=np.uint8)
+for _index, _aa in enumerate(CODE):
+    _codon = ["TCAG"[_index // 16], "TCAG"[_index // 4 % 4], "TCAG"[_index % 4]]
+    TABLE[sum(BASES.index(base) * 4 ** (2 - i) for i, base in enumerate(_codon))] = ord(_aa)
+START = BASES.index("A") * 16 + BASES.index("T") * 4 + BASES.index("G")
+STOP = ord("*")
+
+
+def codon_indexes(nucleotides):
+    """
+    Return the codon index starting at every position of an
+    encoded sequence (64 for codons with ambiguous bases).
+    """
+    first, second, third = nucleotides[:-2], nucleotides[1:-1], nucleotides[2:]
+    codons = first * 16 + second * 4 + third
+    codons[(first > 3) | (second > 3) | (third > 3)] = 64
+    return codons
+
+
+def strand_orfs(nucleotides, min_length):
+    """
+    Find the ORFs of the three frames of one strand. Each ORF starts
+    at the first ATG after the previous in-frame stop codon and ends
+    with a stop codon. Returns (start, end, protein) tuples, with
+    0-based coordinates of the first and last (stop codon) nucleotides.
+    """
+    codons_at = codon_indexes(nucleotides)
+    orfs = []
+    for frame in range(3):
+        codons = codons_at[frame::3]
+        protein = TABLE[codons]
+        stops = np.flatnonzero(protein == STOP)
+        starts = np.flatnonzero(codons == START)
+        if not len(stops) or not len(starts):
+            continue
+        # First ATG after the previous stop codon of the frame
+        previous = np.concatenate(([-1], stops[:-1]))
+        first = np.searchsorted(starts, previous + 1)
+        valid = first < len(starts)
+        first = np.minimum(first, len(starts) - 1)
+        valid &= starts[first] < stops
+        begin = starts[first][valid]
+        end = stops[valid]
+        keep = (end - begin + 1) * 3 >= min_length
+        for codon_start, codon_end in zip(begin[keep], end[keep]):
+            orfs.append((frame + 3 * codon_start, frame + 3 * codon_end + 2,
+                         protein[codon_start:codon_end].tobytes().decode()))
+    return orfs
+
+
+def find_orfs(sequence, min_length=75, circular=False, nested=True):
+    """
+    Six-frame ORF prediction on a genome sequence. Returns a list of
+    (start, stop, protein) tuples with 1-based coordinates, where
+    start > stop for ORFs on the minus strand. Circular genomes also
+    report the ORFs spanning the origin, and nested ORFs (completely
+    placed within another) are dropped unless nested is set.
+    """
+    genome = np.frombuffer(str(sequence).encode(), dtype=np.uint8)
+    size = len(genome)
+    copies = 3 if circular else 1
+    forward = NUCLEOTIDES[np.tile(genome, copies)]
+    # Complement of the 0-3 encoding is 3 - base, unknown bases stay as 4
+    reverse = np.where(forward < 4, 3 - forward, 4)[::-1]
+    length = len(forward)
+
+    intervals = []
+    for strand, nucleotides in (("+", forward), ("-", reverse)):
+        for start, end, protein in strand_orfs(nucleotides, min_length):
+            if circular and not (size <= start < 2 * size and end - start < size):
+                # Circular genomes are searched on three copies, only ORFs
+                # starting on the middle one are reported
+                continue
+            if strand == "+":
+                low, high = start, end
+            else:
+                low, high = length - 1 - end, length - 1 - start
+            if circular:
+                # Genome coordinates, ORFs spanning the origin end after size
+                low, high = low % size, low % size + high - low
+            intervals.append((low, high, strand, protein))
+
+    intervals.sort(key=lambda orf: (orf[0], -orf[1]))
+    if not nested and intervals:
+        # ORFs spanning the origin also contain the ORFs at the genome start,
+        # so they are added shifted by -size as containers only
+        containers = [(low - size, high - size) for low, high, _, _ in intervals
+                      if circular and high >= size]
+        bounds = sorted([(low, high, -1) for low, high in containers] +
+                        [(orf[0], orf[1], i) for i, orf in enumerate(intervals)],
+                        key=lambda bound: (bound[0], -bound[1]))
+        high = np.array([bound[1] for bound in bounds])
+        # An ORF is nested when a previous (lower or equal start) ORF ends after it
+        reach = np.maximum.accumulate(np.concatenate(([-1], high[:-1])))
+        inside = {bound[2] for bound, nested_orf in zip(bounds, high <= reach)
+                  if nested_orf and bound[2] >= 0}
+        intervals = [orf for i, orf in enumerate(intervals) if i not in inside]
+
+    orfs = []
+    for low, high, strand, protein in intervals:
+        low, high = int(low % size) + 1, int(high % size) + 1
+        if strand == "+":
+            orfs.append((low, high, protein))
+        else:
+            orfs.append((high, low, protein))
+    return orfs
+
+
+def predict_genome(args):
+    """
+    Return the predicted ORFs of every genome in a fasta file, with
+    NCBI proteome style headers.
+    >lcl|NC_XXXXXX.1_prot_ORF_25279:25503_predicted
+    """
+    fasta, min_length, circular, nested = args
+    records = []
+    for genome in SeqIO.parse(fasta, "fasta"):
+        for start, stop, protein in find_orfs(genome.seq, min_length, circular, nested):
+            records.append(f">lcl|{genome.id}_prot_ORF_{start}:{stop}_predicted\n{protein}\n")
+    return "".join(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+    description='Predicts the ORFs of genomes in fasta format, with the ORFfinder options used in the workflow',
+    usage='orf_finder.py -in <genomes> [-out <output>] [-ml 75] [-c t] [-n t]')
+    parser.add_argument('-in', dest='genomes', nargs='+', required=True, help='Genomes in fasta format')
+    parser.add_argument('-out', dest='output', help='Output file (default: standard output)')
+    parser.add_argument('-s', type=int, choices=[0], default=0, help='ORF start codon, only ATG (0) is supported')
+    parser.add_argument('-ml', type=int, default=75, help='Minimal length of the ORF (nt)')
+    parser.add_argument('-c', choices=['t', 'f'], default='f', help='Genomes are circular')
+    parser.add_argument('-n', choices=['t', 'f'], default='f', help='Ignore nested ORFs')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of genome files processed in parallel')
+    args = parser.parse_args()
+
+    tasks = [(genome, args.ml, args.c == 't', args.n != 't') for genome in args.genomes]
+    fh = open(args.output, "w") if args.output else sys.stdout
+    if args.jobs > 1:
+        with ProcessPoolExecutor(args.jobs) as executor:
+            for records in executor.map(predict_genome, tasks):
+                fh.write(records)
+    else:
+        for task in tasks:
+            fh.write(predict_genome(task))
+    if args.output:
+        fh.close()
+
+
+if __name__ == '__main__':
+    main()
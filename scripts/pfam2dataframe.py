@@ -1,40 +1,108 @@
 #!/usr/bin/env python3
 
 import argparse
-from Bio import SearchIO
+import csv
+import sys
 
+SUMMARY_COLUMNS = ["Protein", "Domain", "Pfam_ID", "E-value",
+                   "Domain_E-value", "Sequence_coverage"]
+DOMAIN_COLUMNS = ["Protein", "Domain", "Pfam_ID", "Domain_number",
+                  "HMM_start", "HMM_end", "Ali_start", "Ali_end",
+                  "Env_start", "Env_end", "Domain_E-value", "Domain_score",
+                  "Sequence_coverage", "Profile_coverage"]
 
-def pfam2dataframe(filename):
+
+def read_domains(filename):
+    '''
+    Stream a hmmscan domain table (--domtblout) and yield the query
+    name, the full sequence E-value of the hit and a DOMAIN_COLUMNS
+    row for each domain. Domains come in the file order, the first
+    one of each query being the first domain of its best hit.
+    '''
+    with open(filename, "r") as fh:
+        for line in fh:
+            if line.startswith("#"):
+                continue
+            fields = line.split(None, 22)
+            identifier = "_".join(fields[3].split("_")[3:5])
+            profile_length, query_length = int(fields[2]), int(fields[5])
+            hmm_start, hmm_end = int(fields[15]), int(fields[16])
+            ali_start, ali_end = int(fields[17]), int(fields[18])
+            yield fields[3], float(fields[6]), [
+                identifier, fields[0], fields[1], int(fields[9]),
+                hmm_start, hmm_end, ali_start, ali_end,
+                int(fields[19]), int(fields[20]), float(fields[12]),
+                float(fields[13]),
+                (ali_end - ali_start + 1) / query_length * 100,
+                (hmm_end - hmm_start + 1) / profile_length * 100]
+
+
+class TableWriter:
+    '''
+    Write rows to a CSV file (or standard output), or to a
+    Parquet file when the file name ends with .parquet.
+    '''
+
+    def __init__(self, filename, columns):
+        self.filename = filename
+        self.columns = columns
+        self.parquet = filename is not None and filename.endswith(".parquet")
+        self.rows = []
+        if not self.parquet:
+            self.fh = open(filename, "w", newline="") if filename else sys.stdout
+            self.writer = csv.writer(self.fh, lineterminator="\n")
+            self.writer.writerow(columns)
+
+    def write(self, row):
+        if self.parquet:
+            self.rows.append(row)
+        else:
+            self.writer.writerow(row)
+
+    def close(self):
+        if self.parquet:
+            import pandas as pd
+            pd.DataFrame(self.rows, columns=self.columns).to_parquet(self.filename, index=False)
+        elif self.filename:
+            self.fh.close()
+
+
+def pfam2dataframe(filename, outfile=None, domains_file=None):
     '''
     Returns the first hit of each query in a HMM search.
     Output columns format:
     Protein,Domain,Pfam_ID,E-value,Domain_E-value,Sequence_coverage
+    When a domains file is given, every domain is also written
+    there (DOMAIN_COLUMNS).
     '''
-    search = SearchIO.parse(filename, 'hmmscan3-domtab')
-    print("Protein,Domain,Pfam_ID,E-value,Domain_E-value,Sequence_coverage")
-    for query in search:
-        identifier = "_".join(query.id.split("_")[3:5])
-        try:
-            domain_name = query[0].id
-            domain_id = query[0].accession
-            evalue = query[0].evalue
-            hsp = query[0][0]
-            evalue_dom = hsp.evalue
-            coverage = (hsp.query_end - hsp.query_start) / query.seq_len * 100
-            print(f'{identifier},{domain_name},{domain_id},{evalue},{evalue_dom},{coverage}')
-        except IndexError:
-            print(f'{identifier},NaN,NaN,NaN,NaN')
+    summary = TableWriter(outfile, SUMMARY_COLUMNS)
+    table = TableWriter(domains_file, DOMAIN_COLUMNS) if domains_file else None
+    query = None
+    for name, evalue, domain in read_domains(filename):
+        if table is not None:
+            table.write(domain)
+        # First domain of each query, from its best hit
+        if name != query:
+            query = name
+            summary.write([domain[0], domain[1], domain[2], evalue,
+                           domain[10], domain[12]])
+    summary.close()
+    if table is not None:
+        table.close()
 
 
 def main():
     parser = argparse.ArgumentParser(
             description='Return the first hit for each query of a HMM search',
-            usage='pfam2dataframe.py <hmm_search_results>',
+            usage='pfam2dataframe.py <hmm_search_results> [-o <summary>] [--domains <table>]',
             epilog="""
+            Output files ending with .parquet are written in Parquet format, otherwise CSV
             """)
     parser.add_argument('hmmfile')
+    parser.add_argument('-o', '--outfile', help='Best hits table (default: standard output)')
+    parser.add_argument('--domains', help='Table with every domain of the search')
     args = parser.parse_args()
-    pfam2dataframe(args.hmmfile)
+    pfam2dataframe(args.hmmfile, args.outfile, args.domains)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+
+# MAFFT strategies, from the most accurate to the fastest
+TIERS = {
+    "L-INS-i": "mafft --localpair --maxiterate 1000",
+    "FFT-NS-2": "mafft --retree 2 --maxiterate 0",
+}
+# Largest orthogroups aligned with L-INS-i (MAFFT recommended limits)
+MAX_SEQS = 200
+MAX_LENGTH = 2000
+
+
+def read_sequences(seqfile):
+    """
+    Return the (identifier, sequence) pairs of a fasta file.
+    """
+
+    sequences = []
+    with open(seqfile, "r") as fh:
+        for line in fh:
+            if line.startswith(">"):
+                sequences.append([line[1:].split(None, 1)[0], []])
+            elif sequences:
+                sequences[-1][1].append(line.strip())
+    return [(identifier, "".join(seq)) for identifier, seq in sequences]
+
+
+def select_tier(sequences, max_seqs=MAX_SEQS, max_length=MAX_LENGTH):
+    """
+    Return the alignment strategy of an orthogroup. L-INS-i is
+    used for groups with up to max_seqs sequences of mean length
+    up to max_length, and FFT-NS-2 for larger ones.
+    """
+
+    count = len(sequences)
+    mean_length = sum(len(seq) for _, seq in sequences) / count if count else 0
+    if count <= max_seqs and mean_length <= max_length:
+        return "L-INS-i"
+    return "FFT-NS-2"
+
+
+def profile_key(sequences, aligner):
+    """
+    Return the cache key of an orthogroup, the SHA-256 digest of
+    its sorted member sequences and the aligner command.
+    """
+
+    digest = hashlib.sha256(aligner.encode())
+    for identifier, seq in sorted(sequences):
+        digest.update(f"\n>{identifier}\n{seq}".encode())
+    return digest.hexdigest()
+
+
+def describe_profile(profile, tier):
+    """
+    Record the alignment strategy in the DESC line of a HMM profile.
+    """
+
+    with open(profile, "r") as fh:
+        lines = [line for line in fh if not line.startswith("DESC ")]
+    with open(profile, "w") as fh:
+        for line in lines:
+            fh.write(line)
+            if line.startswith("NAME "):
+                fh.write(f"DESC  {tier} alignment ({TIERS[tier]})\n")
+
+
+def rename_profile(source, target, name):
+    """
+    Copy a HMM profile replacing its model name.
+    """
+
+    with open(source, "r") as src, open(target, "w") as dst:
+        for line in src:
+            if line.startswith("NAME "):
+                line = f"NAME  {name}\n"
+            dst.write(line)
+
+
+def run(command):
+    """
+    Run a shell command, returning an error message when it fails.
+    """
+
+    process = subprocess.run(command, shell=True, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode:
+        error = process.stderr.strip().splitlines()
+        return f"{command.split()[0]} exited with code {process.returncode}" + \
+               (f": {error[-1]}" if error else "")
+    return None
+
+
+def build_profile(seqfile, alignment, profile, cache_dir=None,
+                  max_seqs=MAX_SEQS, max_length=MAX_LENGTH):
+    """
+    Align a multifasta file and build its HMM profile, named after
+    the alignment file. The alignment strategy is chosen by
+    select_tier() and recorded in the profile description. When a
+    cache directory is given, alignments and profiles are stored
+    there by profile_key() and reused for orthogroups with the same
+    sequences. Returns the error message of the failed step, or None.
+    """
+
+    name = Path(alignment).stem
+    sequences = read_sequences(seqfile)
+    tier = select_tier(sequences, max_seqs, max_length)
+    aligner = TIERS[tier]
+    if cache_dir is not None:
+        key = profile_key(sequences, aligner)
+        cached = Path(cache_dir) / key[:2] / key
+        cached_aln = cached.with_suffix(".aln")
+        cached_hmm = cached.with_suffix(".hmm")
+        if cached_aln.exists() and cached_hmm.exists():
+            shutil.copyfile(cached_aln, alignment)
+            rename_profile(cached_hmm, profile, name)
+            return None
+
+    error = (run(f"{aligner} {seqfile} > {alignment}") or
+             run(f"hmmbuild {profile} {alignment}"))
+    if error:
+        return error
+    describe_profile(profile, tier)
+    if cache_dir is None:
+        return None
+
+    # Store the new profile, temporal copies are renamed so that
+    # concurrent builds never see incomplete files
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    for source, target in ((alignment, cached_aln), (profile, cached_hmm)):
+        temporal = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(source, temporal)
+        os.replace(temporal, target)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Aligns a multifasta file and builds its HMM profile, reusing cached profiles',
+        usage='profile_builder.py <seqfile> <alignment> <profile> [--cache-dir DIR]')
+    parser.add_argument('seqfile', help='Multifasta file')
+    parser.add_argument('alignment', help='Output alignment')
+    parser.add_argument('profile', help='Output HMM profile')
+    parser.add_argument('--cache-dir', help='Alignments and profiles cache')
+    parser.add_argument('--linsi-max-seqs', type=int, default=MAX_SEQS, help='Largest number of sequences aligned with L-INS-i')
+    parser.add_argument('--linsi-max-length', type=int, default=MAX_LENGTH, help='Largest mean sequence length aligned with L-INS-i')
+    args = parser.parse_args()
+    error = build_profile(args.seqfile, args.alignment, args.profile, args.cache_dir,
+                          args.linsi_max_seqs, args.linsi_max_length)
+    if error:
+        parser.exit(1, f"{error}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,53 @@
 #!/usr/bin/env python3
 
 import argparse
-from Bio import SeqIO
+import sys
 
 
-def annotate_orfs(orfs):
+def rename_header(header):
     """
-    Takes a multifaste containing ORFs predicted by ORFfinder
-    and modify the header to have the same format as NCBI
-    proteome fasta.
+    Convert an ORFfinder header line into the NCBI proteome format.
     0-based index from ORFfinder is changed to 1-based index.
 
     >lcl|ORF5_NC_XXXXXX.1:25278:25502 -> >lcl|NC_XXXXXX.1_prot_ORF_25279:25503_predicted
     """
 
-    seqs = SeqIO.parse(orfs, "fasta")
-    for seq in seqs:
-        if "ORF" in seq.id:
-            species = "_".join(seq.id.split(":")[0].split("_")[1:])
-            start = int(seq.id.split(":")[1]) + 1
-            stop = int(seq.id.split(":")[2]) + 1
-            new_id = f"lcl|{species}_prot_ORF_{start}:{stop}_predicted"
-            print(f">{new_id}\n{seq.seq}")
+    identifier = header[1:].split(None, 1)[0]
+    name, start, stop = identifier.split(b":")[:3]
+    species = b"_".join(name.split(b"_")[1:])
+    return b">lcl|%s_prot_ORF_%d:%d_predicted\n" % (species, int(start) + 1, int(stop) + 1)
+
+
+def annotate_orfs(orfs, output=None):
+    """
+    Takes a multifaste containing ORFs predicted by ORFfinder
+    and modify the header to have the same format as NCBI
+    proteome fasta.
+    Only header lines are parsed, sequence lines are streamed as
+    raw bytes to a buffered binary output (standard output by default).
+    Records without ORF in the identifier are skipped.
+    The workflow predicts ORFs with orf_finder.py, which already
+    writes this format, so this is only needed for ORFs predicted
+    externally with NCBI ORFfinder.
+    """
+
+    if output is None:
+        output = sys.stdout.buffer
+    keep = False
+    with open(orfs, "rb") as fh:
+        for line in fh:
+            if line.startswith(b">"):
+                keep = b"ORF" in line[1:].split(None, 1)[0]
+                if keep:
+                    output.write(rename_header(line))
+            elif keep:
+                output.write(line)
+    output.flush()
 
 
 def main():
     parser = argparse.ArgumentParser(
-    description='Takes a fasta file with predicted ORFs from ORFfinder and fixes the headers',
+    description='Takes a fasta file with predicted ORFs from NCBI ORFfinder (not used by the workflow, orf_finder.py already writes NCBI style headers) and fixes the headers',
     usage='rename_predicted_orfs <orfs>')
     parser.add_argument('orfs', help='ORFs to rename in fasta format')
     args = parser.parse_args()
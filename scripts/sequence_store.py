@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import argparse
+import mmap
+import os
+
+
+def build_index(fasta):
+    """
+    Scan a fasta file once and return a dictionary with the
+    sequence identifiers (in file order) as keys and the
+    (offset, size in bytes, length) of each sequence as values.
+    """
+
+    index = {}
+    identifier = None
+    offset = 0
+    with open(fasta, "rb") as fh:
+        for line in fh:
+            if line.startswith(b">"):
+                if identifier is not None:
+                    index[identifier] = (start, offset - start, length)
+                identifier = line[1:].split(None, 1)[0].decode()
+                start = offset + len(line)
+                length = 0
+            else:
+                length += len(line.rstrip())
+            offset += len(line)
+    if identifier is not None:
+        index[identifier] = (start, offset - start, length)
+    return index
+
+
+def fasta_signature(fasta):
+    """
+    Return the (size, modification time in ns) of a fasta file,
+    used to check that an index still describes it.
+    """
+
+    stat = os.stat(fasta)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def write_index(index, filename, signature=(0, 0)):
+    """
+    Write a sequences index as a tab separated file, after a
+    header with the signature of the indexed fasta. The index is
+    written to a temporal file and renamed, so that concurrent
+    readers never see a partial index.
+    """
+
+    temporal = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(temporal, "w") as fh:
+            fh.write("#\t{}\t{}\n".format(*signature))
+            for identifier, (offset, size, length) in index.items():
+                fh.write(f"{identifier}\t{offset}\t{size}\t{length}\n")
+        os.replace(temporal, filename)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def read_index(filename):
+    """
+    Read a sequences index written by write_index(). Returns
+    the signature of the indexed fasta and the index.
+    """
+
+    index = {}
+    signature = None
+    with open(filename, "r") as fh:
+        for line in fh:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] == "#":
+                signature = (int(fields[1]), int(fields[2]))
+                continue
+            identifier, offset, size, length = fields
+            index[identifier] = (int(offset), int(size), int(length))
+    return signature, index
+
+
+def load_index(fasta):
+    """
+    Return the index of a fasta file. The index is stored next
+    to the fasta (<fasta>.idx) and only rebuilt when the size or
+    modification time of the fasta differs from the indexed one.
+    """
+
+    filename = f"{fasta}.idx"
+    signature = fasta_signature(fasta)
+    if os.path.exists(filename):
+        try:
+            indexed, index = read_index(filename)
+            if indexed == signature:
+                return index
+        except (OSError, ValueError):
+            # Unreadable indexes are rebuilt
+            pass
+    index = build_index(fasta)
+    try:
+        write_index(index, filename, signature)
+    except OSError:
+        # Read-only locations still get an in-memory index
+        pass
+    return index
+
+
+class SequenceStore:
+    """
+    Random access to the sequences of a fasta file by identifier.
+    Sequences are read through a memory map of the file, so only
+    the offsets index is kept in memory.
+    """
+
+    def __init__(self, fasta):
+        self.fasta = fasta
+        self.index = load_index(fasta)
+        self._fh = open(fasta, "rb")
+        if os.path.getsize(fasta):
+            self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b""
+
+    def __contains__(self, identifier):
+        return identifier in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def fetch(self, identifier):
+        """
+        Return the sequence of an identifier as a string.
+        Raises KeyError for identifiers not present in the file.
+        """
+        offset, size, _ = self.index[identifier]
+        raw = self._map[offset:offset + size]
+        return raw.replace(b"\n", b"").replace(b"\r", b"").decode()
+
+    def length(self, identifier):
+        """
+        Return the length of a sequence without reading it.
+        """
+        return self.index[identifier][2]
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._fh.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Builds the index of a fasta file and retrieves sequences by identifier',
+            usage='sequence_store.py <fasta> [identifiers]')
+    parser.add_argument('fasta', help='Fasta sequences file')
+    parser.add_argument('identifiers', nargs='*', help='Sequences to print')
+    args = parser.parse_args()
+    with SequenceStore(args.fasta) as store:
+        for identifier in args.identifiers:
+            print(f">{identifier}\n{store.fetch(identifier)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import argparse
+import heapq
+from sequence_store import load_index
+
+
+def assign_shards(index, n_shards):
+    """
+    Assign the sequences of a fasta index to shards with balanced
+    total residues, placing the longest sequences first on the
+    lightest shard. Returns a dictionary with identifiers as keys
+    and shard numbers as values.
+    """
+
+    # (residues, shard) heap of the shards load
+    loads = [(0, shard) for shard in range(n_shards)]
+    shards = {}
+    for identifier in sorted(index, key=lambda identifier: -index[identifier][2]):
+        residues, shard = heapq.heappop(loads)
+        shards[identifier] = shard
+        heapq.heappush(loads, (residues + index[identifier][2], shard))
+    return shards
+
+
+def shard_fasta(multifasta, outputs):
+    """
+    Split a multifasta file into one shard per output file. Each
+    shard keeps the sequences in their original order.
+    """
+
+    shards = assign_shards(load_index(multifasta), len(outputs))
+    handles = [open(output, "w") for output in outputs]
+    try:
+        with open(multifasta, "r") as fh:
+            out = None
+            for line in fh:
+                if line.startswith(">"):
+                    out = handles[shards[line[1:].split(None, 1)[0]]]
+                if out is not None:
+                    out.write(line)
+    finally:
+        for out in handles:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Splits a multifasta file into shards with balanced total residues',
+        usage='shard_fasta.py <multifasta> -o <shard> [<shard> ...]')
+    parser.add_argument('multifasta', help='Fasta sequences file')
+    parser.add_argument('-o', '--outputs', nargs='+', required=True, help='Shard files')
+    args = parser.parse_args()
+    shard_fasta(args.multifasta, args.outputs)
+
+
+if __name__ == '__main__':
+    main()
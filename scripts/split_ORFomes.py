@@ -1,44 +1,98 @@
 #!/usr/bin/env python3
 
 import argparse
-from Bio import SeqIO
+from collections import OrderedDict
+from pathlib import Path
 
 
-def split_ORFomes(multifasta):
+class HandlePool:
+    """
+    Bounded pool of open output files. When the limit is reached
+    the least recently used file is closed, and it is reopened in
+    append mode the next time it is written.
+    """
+
+    def __init__(self, limit=64):
+        self.limit = limit
+        self.handles = OrderedDict()
+        self.created = set()
+
+    def get(self, filename):
+        """
+        Return an open handle for filename.
+        """
+        if filename in self.handles:
+            self.handles.move_to_end(filename)
+            return self.handles[filename]
+        if len(self.handles) >= self.limit:
+            _, handle = self.handles.popitem(last=False)
+            handle.close()
+        # Files are truncated the first time they are opened in the run
+        mode = "a" if filename in self.created else "w"
+        self.created.add(filename)
+        self.handles[filename] = open(filename, mode)
+        return self.handles[filename]
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+
+def write_record(files, directory, identifier, seq):
+    """
+    Write a sequence into the proteome file of its species.
+    """
+    specie = "NC_" + identifier.split("_")[1][:-2]
+    fh = files.get(directory / f"{specie}.faa")
+    # Fasta format
+    fh.write(f">{identifier}\n{''.join(seq)}\n")
+
+
+def split_ORFomes(multifasta, outdir=".", max_open=64):
     """
     Split a multifasta file into individual proteomes
-    based on species identifier.
+    based on species identifier. Each record is written
+    as soon as it is read, only one is kept in memory.
     """
-    # Ingest sequences
-    seqs = SeqIO.parse(multifasta, "fasta")
-    # Initializa proteomes dictionary
-    proteomes = {}
-    # Store each proteome in the dict
-    for seq in seqs:
-        specie = "NC_" + seq.id.split("_")[1][:-2]
-        if specie not in proteomes:
-            proteomes[specie] = [seq]
-        elif specie in proteomes:
-            proteomes[specie].append(seq)
-
-    # Write each proteome separately to a file
-    for proteome in proteomes:
-        # Set directory destination
-        filename = f"{proteome}.faa"
-        with open(filename, "w") as fh:
-            for seq in proteomes[proteome]:
-                # Fasta format
-                fh.write(f">{seq.id}\n{seq.seq}\n")
+    # Set directory destination
+    directory = Path(outdir)
+    directory.mkdir(parents=True, exist_ok=True)
+    files = HandlePool(max_open)
+    identifier = None
+    seq = []
+    try:
+        with open(multifasta, "r") as fh:
+            for line in fh:
+                if line.startswith(">"):
+                    if identifier is not None:
+                        write_record(files, directory, identifier, seq)
+                    identifier = line[1:].split(None, 1)[0]
+                    seq = []
+                else:
+                    seq.append(line.strip())
+            if identifier is not None:
+                write_record(files, directory, identifier, seq)
+    finally:
+        files.close()
 
 
 def main():
     "Command line parser"
     parser = argparse.ArgumentParser(
             description="Splits a multifasta file into individual proteomes",
-            usage="split_ORFomes.py <multifasta>")
+            usage="split_ORFomes.py <multifasta> [-o <outdir>]")
     parser.add_argument("multifasta", help="File containing all proteins")
+    parser.add_argument("-o",
+                        "--outdir",
+                        default=".",
+                        help="Output directory (default: current directory)")
+    parser.add_argument("--max-open",
+                        type=int,
+                        default=64,
+                        help="Maximum number of output files open at once")
     args = parser.parse_args()
-    split_ORFomes(args.multifasta)
+    split_ORFomes(args.multifasta, args.outdir, args.max_open)
 
 
 if __name__ == "__main__":